@@ -0,0 +1,125 @@
+# coding=utf-8
+import random
+import string
+import sys
+import timeit
+
+from bot.utils import line_splitter, split_text
+
+__author__ = "Gareth Coles"
+
+# Compares bot.utils.line_splitter against the string-concatenating version it replaced.
+# Usage: python -m benchmarks.chunking [scale]
+
+
+def old_line_splitter(lines, max_size, split_only=False):
+    finished_lines = []
+    current_line = ""
+
+    if not split_only:
+        for line in lines:
+            if len(current_line) + len(line) + 2 >= max_size:
+                if not current_line:
+                    raise ValueError("Encountered a line longer than {} characters".format(max_size))
+
+                finished_lines.append(current_line)
+                current_line = ""
+
+            current_line += "\n{}".format(line)
+
+        if current_line:
+            finished_lines.append(current_line)
+    else:
+        for line in lines:
+            current_line = line
+
+            while len(current_line) + 2 >= max_size:
+                finished_lines.append(current_line[:max_size - 2])
+                current_line = current_line[max_size - 2:]
+            else:
+                finished_lines.append(current_line)
+
+    return finished_lines
+
+
+def make_words(count):
+    return [
+        "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(2, 10))) for _ in range(count)
+    ]
+
+
+def make_items(count):
+    # A long bulleted list
+    words = make_words(1000)
+    return ["\u2022 " + " ".join(random.sample(words, random.randint(3, 30))) for _ in range(count)]
+
+
+def make_page(paragraphs):
+    # A large URL section, split into paragraphs the same way URLSection does
+    words = make_words(1000)
+    return [
+        "\n".join(" ".join(random.sample(words, 20)) for _ in range(random.randint(1, 40))) + "\n\u200b"
+        for _ in range(paragraphs)
+    ]
+
+
+def check_edge_cases():
+    # Regression checks: no chunk may be empty (Discord refuses to send those) or longer than allowed, and nothing
+    # but separators may go missing
+
+    cases = [
+        "\n" + "x" * 2500,
+        "\n\n" + "x " * 1500,
+        "x" * 2500 + "\n",
+        "\n" * 5,
+        " " * 2500,
+        "\n\n".join(["word " * 500] * 3)
+    ]
+
+    for text in cases:
+        chunks = list(split_text(text, 2000))
+
+        assert all(chunk.strip() for chunk in chunks), [len(chunk) for chunk in chunks]
+        assert all(len(chunk) <= 2000 for chunk in chunks), [len(chunk) for chunk in chunks]
+        assert "".join("".join(chunks).split()) == "".join(text.split())
+
+    assert line_splitter(["\n" + "x" * 2500], 2000, True) == ["x" * 1998, "x" * 502]
+
+
+def bench(name, func, *args, number=5):
+    seconds = min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number
+    print("{:>40}: {:10.3f} ms".format(name, seconds * 1000))
+
+    return seconds
+
+
+def main():
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    random.seed(0)
+    check_edge_cases()
+
+    for count in (1000 * scale, 10000 * scale, 100000 * scale):
+        items = make_items(count)
+        assert line_splitter(items, 2000) == old_line_splitter(items, 2000)
+
+        print("List of {} items ({} characters)".format(count, sum(len(item) for item in items)))
+        old = bench("old line_splitter", old_line_splitter, items, 2000)
+        new = bench("line_splitter", line_splitter, items, 2000)
+        print("{:>40}: {:10.2f}x\n".format("speedup", old / new))
+
+    for paragraphs in (10 * scale, 100 * scale, 1000 * scale):
+        # One huge paragraph is the worst case for the old slicing loop
+        page = make_page(paragraphs)
+        blob = ["\n".join(page)]
+
+        print("Page of {} paragraphs ({} characters)".format(paragraphs, sum(len(part) for part in page)))
+        old = bench("old line_splitter, split_only", old_line_splitter, page, 2000, True)
+        new = bench("line_splitter, split_only", line_splitter, page, 2000, True)
+        print("{:>40}: {:10.2f}x".format("speedup", old / new))
+        old = bench("old line_splitter, one block", old_line_splitter, blob, 2000, True)
+        new = bench("line_splitter, one block", line_splitter, blob, 2000, True)
+        print("{:>40}: {:10.2f}x\n".format("speedup", old / new))
+
+
+if __name__ == "__main__":
+    main()
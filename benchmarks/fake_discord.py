@@ -0,0 +1,395 @@
+# coding=utf-8
+import datetime
+import itertools
+import logging
+import os
+
+import asyncio
+
+from collections import Counter, OrderedDict
+
+import discord
+
+from ruamel import yaml
+
+from benchmarks.synthetic import FakeHTTPPool
+from bot.client import Client
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("FakeDiscord")
+
+# In-memory stand-ins for the parts of Discord the bot touches, so that benchmarks and load tests can drive a real
+# Client without a token or a network connection.
+
+ids = itertools.count(200000000000000000)
+
+OWNER_ID = "100000000000000001"
+
+CONFIG = {
+    "token": "",
+    "owner_id": OWNER_ID,
+    "log_channel": "",
+    "save_delay": 3600  # Saves are measured separately; don't let them fire part-way through
+}
+
+
+# Discord's limits as the fake enforces them: requests per fixed window, in seconds. Message routes are limited per
+# channel, and everything counts against the global limit.
+ROUTE_LIMITS = {
+    "send_message": (5, 5.0),
+    "edit_message": (5, 5.0),
+    "delete_message": (5, 1.0),
+    "delete_messages": (1, 1.0)
+}
+
+GLOBAL_LIMIT = (50, 1.0)
+MAX_RETRIES = 5  # discord.py retries rate-limited requests itself, this many times, before raising
+
+MAX_HISTORY = 1000  # Messages kept per channel
+
+
+def next_id() -> str:
+    return str(next(ids))
+
+
+class FakeResponse:
+    # Enough of an aiohttp response for discord.HTTPException and the send scheduler
+
+    def __init__(self, status, reason, headers=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class FakePermissions:
+    def __init__(self, admin=False):
+        self.manage_server = admin
+        self.manage_messages = admin
+
+
+class FakeUser:
+    def __init__(self, name, user_id=None, discriminator="0001", admin=False):
+        self.id = user_id or next_id()
+        self.name = name
+        self.discriminator = discriminator
+        self.bot = False
+
+        self.server_permissions = FakePermissions(admin)
+
+        self.avatar_url = ""
+        self.default_avatar_url = ""
+
+    @property
+    def mention(self) -> str:
+        return "<@{}>".format(self.id)
+
+
+class FakeChannel:
+    def __init__(self, server, name):
+        self.id = next_id()
+        self.server = server
+        self.name = name
+        self.is_private = False
+
+        self.messages = OrderedDict()  # ID -> FakeMessage, oldest first
+
+    def add_message(self, message):
+        self.messages[message.id] = message
+
+        if len(self.messages) > MAX_HISTORY:
+            # Keeps the fake's own memory use flat under load
+            self.messages.popitem(last=False)
+
+    @property
+    def mention(self) -> str:
+        return "<#{}>".format(self.id)
+
+
+class FakeServer:
+    def __init__(self, name, owner):
+        self.id = next_id()
+        self.name = name
+        self.owner = owner
+
+        self.channels = OrderedDict()  # Name -> FakeChannel
+
+    def add_channel(self, name) -> FakeChannel:
+        channel = FakeChannel(self, name)
+        self.channels[name] = channel
+
+        return channel
+
+    @property
+    def default_channel(self) -> FakeChannel:
+        return next(iter(self.channels.values()))
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content="", embed=None):
+        self.id = next_id()
+        self.channel = channel
+        self.server = channel.server
+        self.author = author
+        self.content = content or ""
+        self.embeds = [embed] if embed else []
+        self.timestamp = datetime.datetime.utcnow()
+
+
+class FakeRateLimit:
+    # A fixed window that starts with the first request, like Discord's buckets
+
+    def __init__(self, capacity, period, loop):
+        self.capacity = capacity
+        self.period = period
+        self.loop = loop
+
+        self.remaining = capacity
+        self.reset_at = 0
+
+    def hit(self) -> float:
+        # Takes a request from the window if there's one left and returns 0; otherwise returns the retry delay
+
+        now = self.loop.time()
+
+        if now >= self.reset_at:
+            self.remaining = self.capacity
+            self.reset_at = now + self.period
+
+        if self.remaining < 1:
+            return self.reset_at - now
+
+        self.remaining -= 1
+        return 0
+
+
+class FakeDiscord(discord.client.Client):
+    # Replaces discord.Client's REST calls with in-memory ones and counts them. Mix it in underneath the real client
+    # - `class FakeClient(Client, FakeDiscord)` - so that everything the Client does on top (metrics, scheduling)
+    # still happens.
+    #
+    # With `rate_limits`, requests are limited as Discord would; like discord.py, a rate-limited request waits out
+    # the Retry-After and tries again, and only raises a 429 HTTPException after MAX_RETRIES. `latency` is added to
+    # every request, in seconds.
+
+    def __init__(self, *args, rate_limits=False, latency=0, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.rate_limits = rate_limits
+        self.latency = latency
+
+        self.fake_user = FakeUser("InfoBot", discriminator="0000")
+        self.fake_servers = OrderedDict()  # ID -> FakeServer
+        self.fake_channels = {}  # ID -> FakeChannel
+
+        self.api_calls = Counter()
+        self.rate_limited = Counter()  # Method -> number of 429s served
+
+        self.global_limit = FakeRateLimit(*GLOBAL_LIMIT, self.loop)
+        self.route_limits = {}  # (method, channel ID) -> FakeRateLimit
+
+    @property
+    def user(self):
+        return self.fake_user
+
+    @property
+    def servers(self):
+        return list(self.fake_servers.values())
+
+    def get_channel(self, channel_id):
+        return self.fake_channels.get(channel_id)
+
+    def create_server(self, name, channels=("general", "info", "notes"), admin=None) -> FakeServer:
+        server = FakeServer(name, admin or FakeUser("Owner", admin=True))
+
+        for channel_name in channels:
+            channel = server.add_channel(channel_name)
+            self.fake_channels[channel.id] = channel
+
+        self.fake_servers[server.id] = server
+        return server
+
+    def not_found(self):
+        return discord.NotFound(FakeResponse(404, "Not Found"), "Unknown Message")
+
+    def get_retry_after(self, method, channel) -> float:
+        if method in ROUTE_LIMITS:
+            key = (method, channel.id)
+
+            if key not in self.route_limits:
+                self.route_limits[key] = FakeRateLimit(*ROUTE_LIMITS[method], self.loop)
+
+            retry_after = self.route_limits[key].hit()
+
+            if retry_after:
+                return retry_after
+
+        return self.global_limit.hit()
+
+    async def api_call(self, method, channel, route=None):
+        # `route` is the rate limit bucket, if it isn't the method's own
+        self.api_calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if not self.rate_limits:
+            return
+
+        for _ in range(MAX_RETRIES):
+            retry_after = self.get_retry_after(route or method, channel)
+
+            if not retry_after:
+                return
+
+            self.rate_limited[method] += 1
+            await asyncio.sleep(retry_after)
+
+        raise discord.HTTPException(
+            FakeResponse(429, "Too Many Requests", {"Retry-After": str(retry_after)}), "You are being rate limited."
+        )
+
+    async def send_message(self, destination, content=None, *, tts=False, embed=None):
+        await self.api_call("send_message", destination)
+
+        message = FakeMessage(destination, self.fake_user, content, embed)
+        destination.add_message(message)
+
+        return message
+
+    async def send_file(self, destination, fp, *, filename=None, content=None, tts=False):
+        await self.api_call("send_file", destination, route="send_message")
+
+        message = FakeMessage(destination, self.fake_user, content)
+        destination.add_message(message)
+
+        return message
+
+    async def edit_message(self, message, new_content=None, *, embed=None):
+        await self.api_call("edit_message", message.channel)
+
+        stored = message.channel.messages.get(message.id)
+
+        if stored is None:
+            raise self.not_found()
+
+        if new_content is not None:
+            stored.content = new_content
+
+        if embed is not None:
+            stored.embeds = [embed]
+
+        return stored
+
+    async def delete_message(self, message):
+        await self.api_call("delete_message", message.channel)
+
+        if message.channel.messages.pop(message.id, None) is None:
+            raise self.not_found()
+
+    async def delete_messages(self, messages):
+        if not 2 <= len(messages) <= 100:
+            raise discord.ClientException("Can only delete messages in the range of [2, 100]")
+
+        channel = messages[0].channel
+        await self.api_call("delete_messages", channel)
+
+        for message in messages:
+            channel.messages.pop(message.id, None)
+
+    async def get_message(self, channel, message_id):
+        await self.api_call("get_message", channel)
+
+        message = channel.messages.get(message_id)
+
+        if message is None:
+            raise self.not_found()
+
+        return message
+
+    async def logs_from(self, channel, limit=100, *, before=None, after=None, around=None, reverse=False):
+        # Newest first, like the real thing. Only `limit` and `before` are supported.
+
+        await self.api_call("logs_from", channel)
+
+        messages = list(channel.messages.values())
+
+        if before is not None:
+            # IDs are snowflakes, so they sort by age - and `before` may well have been deleted already
+            messages = [message for message in messages if int(message.id) < int(before.id)]
+
+        for message in reversed(messages[-limit:]):
+            yield message
+
+
+class FakeGateway:
+    # Delivers messages to the client the way discord.py's websocket does: every event is handled in a task of its
+    # own, and an exception in one is logged without affecting the others
+
+    def __init__(self, client):
+        self.client = client
+        self.loop = client.loop
+
+        self.tasks = set()
+        self.dispatched = 0
+        self.errors = 0
+        self.latencies = []  # Seconds from dispatch until on_message returned
+
+    def dispatch(self, message):
+        self.dispatched += 1
+
+        task = self.loop.create_task(self.handle(message, self.loop.time()))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, message, dispatched):
+        try:
+            await self.client.on_message(message)
+        except Exception:
+            self.errors += 1
+            log.exception("Error handling message: {}".format(message.content[:100]))
+        finally:
+            self.latencies.append(self.loop.time() - dispatched)
+
+    async def replay(self, messages, rate):
+        # Dispatches each message in turn, `rate` per second. If we fall behind, we catch up in a burst rather than
+        # slowing down, just as a busy gateway would.
+
+        start = self.loop.time()
+
+        for sent, message in enumerate(messages):
+            delay = start + sent / rate - self.loop.time()
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            self.dispatch(message)
+
+    async def drain(self):
+        # Waits for every message dispatched so far to be handled
+
+        while self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+
+def write_config(directory, **config) -> dict:
+    # Client reads config.yml (and the YAML backend its data/ directory) from the working directory, so run it from
+    # `directory` after calling this
+
+    config = dict(CONFIG, **config)
+
+    with open(os.path.join(directory, "config.yml"), "w") as fh:
+        yaml.safe_dump(config, fh, default_flow_style=False)
+
+    return config
+
+
+class FakeClient(Client, FakeDiscord):
+    # The real client, commands and all, running against the fake Discord and serving URL sections from `pages`
+
+    def __init__(self, *, loop=None, pages=None, **options):
+        super().__init__(loop=loop, **options)
+
+        self.http_pool.close()
+        self.http_pool = FakeHTTPPool(pages)
+        self.gist_cache.pool = self.http_pool
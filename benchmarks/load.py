@@ -0,0 +1,269 @@
+# coding=utf-8
+import argparse
+import asyncio
+import copy
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from bot.data import DEFAULT_CONFIG, DEFAULT_PUBLISHED
+from bot.metrics import metrics, format_counts, format_timers
+
+from benchmarks.fake_discord import FakeClient, FakeGateway, FakeMessage, FakeUser, write_config
+from benchmarks.suite import format_size, format_time
+from benchmarks.synthetic import Generator
+
+__author__ = "Gareth Coles"
+
+# Load-tests the whole command pipeline: the real Client, running against the fake Discord with its rate limits,
+# is fed a stream of synthetic messages across many servers. Reports end-to-end throughput and latency, how
+# `update` copes with the rate limits, and (with --memory) how much memory is retained under load.
+#
+# Usage: python -m benchmarks.load [--servers N] [--messages N] [--rate N] [--update-servers N] [--scale N]
+#                                  [--latency S] [--storage yaml|sqlite] [--no-rate-limits] [--memory]
+
+# What the replayed messages look like: (weight, whether an admin sends it, content)
+TRAFFIC = [
+    (94, False, lambda generator: generator.sentence()),
+    (3, False, lambda generator: "!{}".format(generator.word())),
+    (2, True, lambda generator: "!section \"FAQ\" set \"{}?\" \"{}\"".format(generator.word(), generator.sentence())),
+    (1, False, lambda generator: "!help")
+]
+
+MEMORY_TOP = 10  # Allocation sites to list
+
+
+class FakeGuild:
+    def __init__(self, server, admin, member):
+        self.server = server
+        self.admin = admin
+        self.member = member
+
+    @property
+    def general(self):
+        return self.server.channels["general"]
+
+
+def create_guilds(client, generator, pages, count, scale):
+    guilds = []
+
+    for i in range(count):
+        admin, member = FakeUser("Admin {}".format(i), admin=True), FakeUser("Member {}".format(i))
+        server = client.create_server("Server {}".format(i), admin=admin)
+
+        config = dict(
+            DEFAULT_CONFIG, info_channel=server.channels["info"].id, notes_channel=server.channels["notes"].id
+        )
+
+        client.data_manager.install_server(
+            server.id, config, client.data_manager.serialise_sections(generator.sections(pages, scale)),
+            generator.notes(10), copy.deepcopy(DEFAULT_PUBLISHED)
+        )
+
+        guilds.append(FakeGuild(server, admin, member))
+
+    return guilds
+
+
+def create_traffic(generator, guilds, count):
+    weights = [weight for weight, _, _ in TRAFFIC]
+    kinds = generator.random.choices(TRAFFIC, weights=weights, k=count)
+    messages = []
+
+    for _, admin, content in kinds:
+        guild = generator.random.choice(guilds)
+        messages.append(FakeMessage(guild.general, guild.admin if admin else guild.member, content(generator)))
+
+    return messages
+
+
+def percentile(values, fraction) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def print_latencies(latencies):
+    print("  Latency: p50 {}, p95 {}, p99 {}, max {}".format(
+        format_time(percentile(latencies, 0.5)), format_time(percentile(latencies, 0.95)),
+        format_time(percentile(latencies, 0.99)), format_time(max(latencies) if latencies else 0)
+    ))
+
+
+class MemorySampler:
+    # Records the traced memory every `interval` seconds while the load test runs
+
+    def __init__(self, loop, interval=1.0):
+        self.loop = loop
+        self.interval = interval
+
+        self.samples = []
+        self.task = None
+
+    async def run(self):
+        while True:
+            self.samples.append(tracemalloc.get_traced_memory()[0])
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = self.loop.create_task(self.run())
+
+    def stop(self):
+        self.task.cancel()
+        self.samples.append(tracemalloc.get_traced_memory()[0])
+
+
+async def run_throughput(client, guilds, messages, rate):
+    gateway = FakeGateway(client)
+    calls = sum(client.api_calls.values())
+    limited = sum(client.rate_limited.values())
+
+    start = client.loop.time()
+    await gateway.replay(messages, rate)
+    replayed = client.loop.time()
+    await gateway.drain()
+    end = client.loop.time()
+
+    print("\nThroughput: {} messages across {} servers, offered at {}/s".format(len(messages), len(guilds), rate))
+    print("  Replayed in {:.2f}s ({:.0f}/s); all handled after {:.2f}s ({:.0f}/s)".format(
+        replayed - start, len(messages) / (replayed - start), end - start, len(messages) / (end - start)
+    ))
+    print_latencies(gateway.latencies)
+    print("  Errors: {}, API calls: {}, rate limited: {}".format(
+        gateway.errors, sum(client.api_calls.values()) - calls, sum(client.rate_limited.values()) - limited
+    ))
+
+    print("  Commands:")
+    print("\n".join(format_timers(metrics.timing("command_seconds", by=("command",)))))
+
+
+async def run_updates(client, guilds, label):
+    gateway = FakeGateway(client)
+
+    sent = client.api_calls["send_message"]
+    edited = client.api_calls["edit_message"]
+    limited = client.rate_limited.copy()
+    surfaced = sum(metrics.count("rate_limited_total").values())
+
+    client.commands.last_used.clear()  # Skip the cooldown from any earlier round
+
+    start = client.loop.time()
+
+    for guild in guilds:
+        gateway.dispatch(FakeMessage(guild.general, guild.admin, "!update"))
+
+    await gateway.drain()
+    duration = client.loop.time() - start
+
+    # Includes each server's "updated" reply
+    messages = client.api_calls["send_message"] - sent + client.api_calls["edit_message"] - edited
+    limited = client.rate_limited - limited
+
+    print("\nUpdate ({}): {} servers at once".format(label, len(guilds)))
+    print("  Done in {:.2f}s; {} messages sent or edited ({:.1f}/s)".format(
+        duration, messages, messages / duration if duration else 0
+    ))
+    print_latencies(gateway.latencies)
+
+    print("  Errors: {}, 429s served: {}, 429s that reached the scheduler: {}".format(
+        gateway.errors, sum(limited.values()), sum(metrics.count("rate_limited_total").values()) - surfaced
+    ))
+
+    if limited:
+        print("\n".join(format_counts({(method,): count for method, count in limited.items()})))
+
+
+def print_memory(sampler, before, after):
+    samples = sampler.samples
+
+    print("\nMemory (traced): {} at start, peak {}, {} at end; {} retained".format(
+        format_size(samples[0]), format_size(max(samples)), format_size(samples[-1]),
+        format_size(samples[-1] - samples[0])
+    ))
+
+    stats = after.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).compare_to(
+        before.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]), "lineno"
+    )
+
+    print("  Largest growth:")
+
+    for stat in stats[:MEMORY_TOP]:
+        frame = stat.traceback[0]
+        print("  {:>12} {:>8} blocks  {}:{}".format(
+            format_size(stat.size_diff), stat.count_diff, frame.filename, frame.lineno
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument("--servers", type=int, default=100, help="Fake servers to spread the traffic over")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages to replay")
+    parser.add_argument("--rate", type=int, default=5000, help="Messages per second to replay them at")
+    parser.add_argument("--update-servers", type=int, default=20, help="Servers to run `update` on at once")
+    parser.add_argument("--scale", type=float, default=0.02, help="Size of each server's sections, as in the suite")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every API call")
+    parser.add_argument("--storage", default="yaml", choices=["yaml", "sqlite"])
+    parser.add_argument("--no-rate-limits", action="store_true", help="Don't enforce Discord's rate limits")
+    parser.add_argument("--memory", action="store_true", help="Trace allocations (slows everything down)")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    generator = Generator()
+    pages = {}
+
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="infobot-load-")
+
+    try:
+        os.chdir(directory)  # The client and the YAML backend work relative to the current directory
+        write_config(directory, storage=args.storage, save_delay=1)
+
+        client = FakeClient(loop=loop, pages=pages, rate_limits=not args.no_rate_limits, latency=args.latency)
+
+        try:
+            guilds = create_guilds(client, generator, pages, max(args.servers, args.update_servers), args.scale)
+            messages = create_traffic(generator, guilds, args.messages)
+
+            if args.memory:
+                tracemalloc.start()
+                sampler = MemorySampler(loop)
+                sampler.start()
+                before = tracemalloc.take_snapshot()
+
+            loop.run_until_complete(run_throughput(client, guilds, messages, args.rate))
+
+            if args.update_servers:
+                updated = guilds[:args.update_servers]
+                loop.run_until_complete(run_updates(client, updated, "full"))
+
+                for guild in updated:
+                    # Change one section, so the next update only has to edit a message or two
+                    section = client.data_manager.get_section(guild.server, "FAQ")
+                    section.set_question(section.questions[0][0], generator.sentence())
+                    section.invalidate()
+
+                loop.run_until_complete(run_updates(client, updated, "incremental"))
+
+            loop.run_until_complete(client.data_manager.flush_async())
+
+            if args.memory:
+                sampler.stop()
+                after = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+
+                print_memory(sampler, before, after)
+
+            print("\nSaves:")
+            print("\n".join(format_timers(metrics.timing("save_seconds"))))
+        finally:
+            loop.run_until_complete(client.close())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+# coding=utf-8
+import argparse
+import asyncio
+import copy
+import gc
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from bot.data import DataManager, DEFAULT_CONFIG, DEFAULT_PUBLISHED
+from bot.sections.url import PARAGRAPH_END
+from bot.storage.sqlite_backend import SQLiteBackend
+from bot.storage.yaml_backend import YAMLBackend
+from bot.utils import line_splitter
+
+from benchmarks.fake_discord import FakeClient, FakeMessage, FakeUser, write_config
+from benchmarks.synthetic import Generator, RenderContext
+
+__author__ = "Gareth Coles"
+
+# Times the bot's hot paths against synthetic servers, without a network or Discord, and reports the peak and
+# retained memory allocated by a single call of each.
+#
+# Usage: python -m benchmarks.suite [--scale N] [--repeat N] [--save results.json] [--compare results.json]
+#                                   [--threshold 1.25] [filter ...]
+#
+# With --compare, any case that got slower than `threshold` times its saved timing is flagged, and the exit status
+# is non-zero - so a saved run from the last release can be used to catch regressions before deploying.
+
+SERVERS = 5  # Servers written to (and loaded from) each storage backend, per unit of scale
+
+
+class Result:
+    def __init__(self, name, seconds, calls, peak, retained):
+        self.name = name
+        self.seconds = seconds  # Best time for a single call
+        self.calls = calls
+        self.peak = peak  # Bytes
+        self.retained = retained  # Bytes
+
+    def to_dict(self) -> dict:
+        return {"seconds": self.seconds, "calls": self.calls, "peak": self.peak, "retained": self.retained}
+
+
+class Suite:
+    def __init__(self, loop, filters=(), repeat=5):
+        self.loop = loop
+        self.filters = filters
+        self.repeat = repeat
+
+        self.results = []
+
+    def wanted(self, name) -> bool:
+        return not self.filters or any(part in name for part in self.filters)
+
+    def measure(self, name, func):
+        # `func` is called with no arguments, and may return a coroutine - which is run to completion
+
+        if not self.wanted(name):
+            return
+
+        def call():
+            result = func()
+
+            if asyncio.iscoroutine(result):
+                result = self.loop.run_until_complete(result)
+
+            return result
+
+        call()  # Warm up caches and anything else that's only set up once
+
+        timer = timeit.Timer(call)
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(repeat=self.repeat, number=number)) / number
+
+        # Allocations are measured separately, since tracing them slows everything down
+        gc.collect()
+        tracemalloc.start()
+
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            call()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = Result(name, seconds, number * self.repeat, peak - before, current - before)
+        self.results.append(result)
+
+        print("{:<48} {:>12} {:>12} {:>12}".format(
+            name, format_time(result.seconds), format_size(result.peak), format_size(result.retained)
+        ))
+
+    def save(self, path):
+        with open(path, "w") as fh:
+            json.dump({result.name: result.to_dict() for result in self.results}, fh, indent=2, sort_keys=True)
+
+    def compare(self, path, threshold) -> int:
+        with open(path, "r") as fh:
+            saved = json.load(fh)
+
+        regressions = 0
+
+        print("\n{:<48} {:>12} {:>12} {:>8}".format("Compared to {}".format(path), "before", "after", "ratio"))
+
+        for result in self.results:
+            if result.name not in saved:
+                continue
+
+            before = saved[result.name]["seconds"]
+            ratio = result.seconds / before if before else 1.0
+
+            if ratio > threshold:
+                regressions += 1
+                flag = "  SLOWER"
+            elif ratio < 1 / threshold:
+                flag = "  faster"
+            else:
+                flag = ""
+
+            print("{:<48} {:>12} {:>12} {:>7.2f}x{}".format(
+                result.name, format_time(before), format_time(result.seconds), ratio, flag
+            ))
+
+        return regressions
+
+
+def format_time(seconds) -> str:
+    if seconds < 1e-3:
+        return "{:.1f} us".format(seconds * 1e6)
+    elif seconds < 1:
+        return "{:.2f} ms".format(seconds * 1e3)
+
+    return "{:.2f} s".format(seconds)
+
+
+def format_size(size) -> str:
+    if abs(size) < 1024:
+        return "{} B".format(size)
+    elif abs(size) < 1024 * 1024:
+        return "{:.1f} KiB".format(size / 1024)
+
+    return "{:.1f} MiB".format(size / 1024 / 1024)
+
+
+def bench_sections(suite: Suite, generator: Generator, scale):
+    pages = {}
+    sections = generator.sections(pages, scale)
+    context = RenderContext(pages)
+
+    for name, section in sections:
+        if section._type == "url":
+            continue
+
+        suite.measure("render: {}".format(section._type), lambda section=section: section.render(context))
+
+    url_section = sections.get("Changelog")
+
+    async def render_fetched():
+        # A cold cache, so the page is downloaded and split every time
+        context.url_cache = type(context.url_cache)()
+        return await url_section.render(context)
+
+    async def render_revalidated():
+        context.url_cache.ttl = 0  # Expired, so we get a 304 and serve the cached copy
+        return await url_section.render(context)
+
+    async def render_cached():
+        context.url_cache.ttl = 300
+        return await url_section.render(context)
+
+    suite.measure("render: url (fetched)", render_fetched)
+    suite.measure("render: url (revalidated)", render_revalidated)
+    suite.measure("render: url (cached)", render_cached)
+
+    for name, section in sections:
+        suite.measure("show: {}".format(section._type), section.show)
+
+
+def bench_chunking(suite: Suite, generator: Generator, scale):
+    items = [generator.sentence() for _ in range(10000 * scale)]
+    page = [generator.paragraph() + PARAGRAPH_END for _ in range(1000 * scale)]
+    blob = ["\n".join(page)]
+
+    suite.measure("line_splitter: {} items".format(len(items)), lambda: line_splitter(items, 2000))
+    suite.measure("line_splitter: {} paragraphs".format(len(page)), lambda: line_splitter(page, 2000, True))
+    suite.measure("line_splitter: one block", lambda: line_splitter(blob, 2000, True))
+
+
+def check_sqlite_deletes(generator: Generator):
+    # Regression check: sections and notes removed since the last save must be deleted, even when that save failed
+    # and we no longer know what the database holds
+
+    def server(sections, notes):
+        return {
+            "config": dict(DEFAULT_CONFIG), "sections": [[name, "text", {"text": name}] for name in sections],
+            "notes": {"number": len(notes), "notes": {note_id: generator.notes(1)["notes"]["1"] for note_id in notes}},
+            "published": None
+        }
+
+    def read():
+        backend = SQLiteBackend("check.sqlite")
+
+        try:
+            _, sections, notes, _ = backend.read_server("1")
+        finally:
+            backend.close()
+
+        return [name for name, _, _ in sections], sorted(notes["notes"])
+
+    backend = SQLiteBackend("check.sqlite")
+
+    try:
+        backend.write_server("1", server("ABCDE", ["1", "2"]))
+
+        broken = server("ABC", ["1"])
+        broken["sections"].append(["D", "text", {"text": object()}])  # Can't be serialised, so the write fails
+
+        try:
+            backend.write_server("1", broken)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("The broken write should have failed")
+
+        backend.write_server("1", server("ABC", ["1"]))
+    finally:
+        backend.close()
+
+    assert read() == (["A", "B", "C"], ["1"]), read()
+
+    # Likewise for a backend that's never seen the server - as when migrating into an existing database
+    for write in ("write_server", "replace_server"):
+        backend = SQLiteBackend("check.sqlite")
+
+        try:
+            getattr(backend, write)("1", server("AB", []))
+        finally:
+            backend.close()
+
+        assert read() == (["A", "B"], []), read()
+
+        backend = SQLiteBackend("check.sqlite")
+
+        try:
+            backend.write_server("1", server("ABC", ["1"]))
+        finally:
+            backend.close()
+
+    os.remove("check.sqlite")
+
+
+def bench_storage(suite: Suite, generator: Generator, scale, loop, name, backend):
+    manager = DataManager(loop=loop, backend=backend, save_delay=3600)
+    server_ids = [str(300000000000000000 + i) for i in range(SERVERS * scale)]
+
+    for server_id in server_ids:
+        sections = generator.sections({}, scale)
+
+        manager.install_server(
+            server_id, dict(DEFAULT_CONFIG), manager.serialise_sections(sections), generator.notes(100 * scale),
+            copy.deepcopy(DEFAULT_PUBLISHED)
+        )
+
+        manager.save_server(server_id)
+
+    server_id = server_ids[0]
+    faq = manager.data[server_id]["sections"].get("FAQ")
+    question = faq.questions[0][0]
+    edits = itertools.count()
+
+    def save_changed():
+        faq.set_question(question, "Answer number {}".format(next(edits)))
+        manager.save_server(server_id)
+
+    def load(lazy):
+        # As the client does it at startup: every server, or only their configs in lazy mode
+        manager.lazy = lazy
+        return manager.load_async()
+
+    async def load_one():
+        # A lazily-loaded server's first command
+        manager.install_lazy_server(server_id, manager.data[server_id]["config"])
+        await manager.ensure_loaded(server_id)
+
+    try:
+        suite.measure("{}: save_server (unchanged)".format(name), lambda: manager.save_server(server_id))
+        suite.measure("{}: save_server (one answer changed)".format(name), save_changed)
+        suite.measure("{}: load_async ({} servers)".format(name, len(server_ids)), lambda: load(False))
+        suite.measure("{}: load_async lazy ({} servers)".format(name, len(server_ids)), lambda: load(True))
+        suite.measure("{}: ensure_loaded (one server)".format(name), load_one)
+    finally:
+        manager.close()
+
+
+def bench_client(suite: Suite, generator: Generator, scale, loop):
+    pages = {}
+    client = FakeClient(loop=loop, pages=pages)
+
+    try:
+        admin = FakeUser("Admin", admin=True)
+        member = FakeUser("Member")
+
+        server = client.create_server("Benchmark Server", admin=admin)
+        channel = server.default_channel
+
+        client.data_manager.install_server(
+            server.id, dict(DEFAULT_CONFIG), client.data_manager.serialise_sections(generator.sections(pages, scale)),
+            generator.notes(100 * scale), copy.deepcopy(DEFAULT_PUBLISHED)
+        )
+
+        def dispatch(author, content):
+            async def handle():
+                await client.on_message(FakeMessage(channel, author, content))
+                channel.messages.clear()  # Don't let our replies pile up between calls
+
+            return handle
+
+        async def show():
+            client.commands.last_used.clear()  # Skip the cooldown
+            await dispatch(admin, "!show")()
+
+        suite.measure("on_message: chatter", dispatch(member, generator.sentence()))
+        suite.measure("on_message: unknown command", dispatch(member, "!{}".format(generator.word())))
+        suite.measure("on_message: permission denied", dispatch(member, "!section \"FAQ\" set \"a\" \"b\""))
+        suite.measure("on_message: help", dispatch(member, "!help"))
+        suite.measure("on_message: section set", dispatch(admin, "!section \"FAQ\" set \"Question?\" \"Answer\""))
+        suite.measure("on_message: show", show)
+
+        suite.measure("publisher: render_messages", lambda: client.publisher.render_messages(server))
+    finally:
+        client.data_manager.take_dirty()  # Nothing needs saving
+        loop.run_until_complete(client.close())
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("filters", nargs="*", help="Only run cases whose names contain one of these")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplies the size of every synthetic server")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case; the best one is reported")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against results saved with --save")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    suite = Suite(loop, args.filters, args.repeat)
+
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="infobot-bench-")
+
+    print("{:<48} {:>12} {:>12} {:>12}".format("Case", "time/call", "peak alloc", "retained"))
+
+    try:
+        os.chdir(directory)  # The client and the YAML backend work relative to the current directory
+        write_config(directory)
+
+        check_sqlite_deletes(Generator())
+
+        bench_chunking(suite, Generator(), args.scale)
+        bench_sections(suite, Generator(), args.scale)
+        bench_storage(suite, Generator(), args.scale, loop, "yaml", YAMLBackend())
+        bench_storage(suite, Generator(), args.scale, loop, "sqlite", SQLiteBackend("data.sqlite"))
+        bench_client(suite, Generator(), args.scale, loop)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.save:
+        suite.save(args.save)
+
+    if args.compare and suite.compare(args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# coding=utf-8
+import datetime
+import random
+import string
+
+from bot.registry import Registry
+from bot.sections.bullet_list import BulletedListSection
+from bot.sections.faq import FAQSection
+from bot.sections.numbered_list import NumberedListSection
+from bot.sections.text import TextSection
+from bot.sections.url import URLSection
+from bot.url_cache import URLCache
+
+__author__ = "Gareth Coles"
+
+# Seeded generators for servers full of large sections, and an in-memory stand-in for the HTTP pool so that URL
+# sections can be rendered without a network.
+
+PAGE_URL = "https://pages.invalid/{}.txt"
+
+
+class Generator:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.words = [self.word() for _ in range(2000)]
+
+    def word(self) -> str:
+        return "".join(self.random.choice(string.ascii_lowercase) for _ in range(self.random.randint(2, 10)))
+
+    def sentence(self, low=3, high=30) -> str:
+        return " ".join(self.random.sample(self.words, self.random.randint(low, high)))
+
+    def paragraph(self, low=1, high=20) -> str:
+        return "\n".join(self.sentence(10, 25) for _ in range(self.random.randint(low, high)))
+
+    def page(self, paragraphs) -> str:
+        return "\n\n".join(self.paragraph() for _ in range(paragraphs))
+
+    def faq(self, name, questions) -> FAQSection:
+        return FAQSection(name, Registry([
+            ["{}?".format(self.sentence(3, 15)), self.sentence(20, 150)] for _ in range(questions)
+        ]))
+
+    def bulleted_list(self, name, items) -> BulletedListSection:
+        return BulletedListSection(name, [self.sentence() for _ in range(items)])
+
+    def numbered_list(self, name, items) -> NumberedListSection:
+        return NumberedListSection(name, [self.sentence() for _ in range(items)])
+
+    def text(self, name, blocks) -> TextSection:
+        return TextSection(name, [self.paragraph()[:1999] for _ in range(blocks)])
+
+    def url(self, name, pages, paragraphs) -> URLSection:
+        url = PAGE_URL.format(len(pages))
+        pages[url] = self.page(paragraphs).encode("utf-8")
+
+        return URLSection(name, url, header="Fetched from <{}>".format(url))
+
+    def sections(self, pages, scale=1) -> Registry:
+        # One of each type, each large enough to span many messages at the default scale. Fractional scales give
+        # smaller servers, for when there are a lot of them.
+
+        def size(count):
+            return max(1, int(count * scale))
+
+        return Registry([
+            ["FAQ", self.faq("FAQ", size(200))],
+            ["Rules", self.numbered_list("Rules", size(500))],
+            ["Links", self.bulleted_list("Links", size(1000))],
+            ["About", self.text("About", size(50))],
+            ["Changelog", self.url("Changelog", pages, size(500))]
+        ])
+
+    def notes(self, count) -> dict:
+        return {
+            "number": count,
+            "notes": {
+                str(i + 1): {
+                    "message_id": None,
+                    "status": self.random.choice(["open", "closed"]),
+                    "text": self.sentence(10, 60),
+                    "submitted": datetime.datetime(2017, 1, 1) + datetime.timedelta(minutes=i),
+                    "submitter": {"id": str(100000000000000000 + i), "name": self.word()}
+                } for i in range(count)
+            }
+        }
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+        self.position = 0
+
+    async def read(self, size=-1) -> bytes:
+        if size < 0:
+            size = len(self.body)
+
+        data = self.body[self.position:self.position + size]
+        self.position += len(data)
+
+        return data
+
+
+class FakeHTTPResponse:
+    def __init__(self, status, reason, headers, body=b""):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.content = FakeContent(body)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeHTTPPool:
+    # Serves `pages` (URL -> bytes) with ETags, so revalidation gets a 304 just like it would from a real server
+
+    def __init__(self, pages=None):
+        self.pages = pages if pages is not None else {}
+        self.requests = 0
+
+    def get(self, url, timeout=None, headers=None) -> FakeHTTPResponse:
+        self.requests += 1
+        body = self.pages.get(url)
+
+        if body is None:
+            return FakeHTTPResponse(404, "Not Found", {})
+
+        etag = '"{}"'.format(hash(body))
+
+        if (headers or {}).get("If-None-Match") == etag:
+            return FakeHTTPResponse(304, "Not Modified", {"ETag": etag})
+
+        return FakeHTTPResponse(200, "OK", {
+            "ETag": etag, "Content-Type": "text/plain; charset=utf-8", "Content-Length": str(len(body))
+        }, body)
+
+    def close(self):
+        pass
+
+
+class RenderContext:
+    # The parts of the client that sections use while rendering
+
+    def __init__(self, pages, url_cache_ttl=300):
+        self.http_pool = FakeHTTPPool(pages)
+        self.url_cache = URLCache(ttl=url_cache_ttl)
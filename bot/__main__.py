@@ -1,27 +1,82 @@
 # coding=utf-8
-import sys
+import gzip
 import logging
+import os
+import queue
+import shutil
+import sys
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from bot.client import Client
 from bot.log_handler import DiscordLogHandler
 
 __author__ = "Gareth Coles"
 
+LOG_FORMAT = "%(asctime)s | %(name)10s | %(levelname)8s | %(message)s"
+CHAT_LOG_FORMAT = "%(asctime)s | %(message)s"
+
+DEFAULT_LOG_MAX_SIZE = 10 * 1024 * 1024  # Bytes
+DEFAULT_LOG_BACKUPS = 5
+
+
+def gzip_namer(name):
+    return name + ".gz"
+
+
+def gzip_rotator(source, destination):
+    with open(source, "rb") as in_file, gzip.open(destination, "wb") as out_file:
+        shutil.copyfileobj(in_file, out_file)
+
+    os.remove(source)
+
+
+def create_file_handler(client, filename, log_format) -> RotatingFileHandler:
+    handler = RotatingFileHandler(
+        filename=filename, encoding="utf-8", maxBytes=client.config.get("log_max_size", DEFAULT_LOG_MAX_SIZE),
+        backupCount=client.config.get("log_backups", DEFAULT_LOG_BACKUPS), delay=True
+    )
+
+    if client.config.get("log_compress", False):
+        handler.namer = gzip_namer
+        handler.rotator = gzip_rotator
+
+    if os.path.exists(filename) and os.path.getsize(filename):
+        handler.doRollover()  # Start every run with a fresh file, keeping the last one as a backup
+
+    handler.setFormatter(logging.Formatter(log_format))
+    return handler
+
+
+def create_queue_logger(*handlers):
+    # Records are handed to a background thread, which does the actual (blocking) writing - so logging never
+    # stalls the event loop
+
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    return QueueHandler(log_queue), listener
+
 
 def main():
     client = Client()
+    listeners = []
 
-    file_handler = logging.FileHandler(
-        filename="output.log", encoding="utf-8", mode="w"
-    )
+    file_handler = create_file_handler(client, "output.log", LOG_FORMAT)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    queue_handler, listener = create_queue_logger(file_handler, stream_handler)
+    listeners.append(listener)
 
     if "--no-log-discord" in sys.argv:
-        handlers = [file_handler, logging.StreamHandler()]
+        handlers = [queue_handler]
     else:
-        handlers = [DiscordLogHandler(client), file_handler, logging.StreamHandler()]
+        # This one's already non-blocking, and wants the original records (with their exception info)
+        handlers = [DiscordLogHandler(client), queue_handler]
 
     logging.basicConfig(
-        format="%(asctime)s | %(name)10s | %(levelname)8s | %(message)s",
         level=logging.DEBUG if "--debug" in sys.argv else logging.INFO,
         handlers=handlers
     )
@@ -29,7 +84,25 @@ def main():
     logging.getLogger("discord").setLevel(logging.WARNING)
     logging.getLogger("websockets.protocol").setLevel(logging.INFO)
 
-    client.run(client.get_token(), bot=True)
+    # Chat logging is high-volume, so it gets its own file and doesn't go anywhere else
+    chat_logger = logging.getLogger("Chat")
+    chat_logger.propagate = False
+
+    if client.config.get("chat_log", False):
+        chat_handler, listener = create_queue_logger(create_file_handler(client, "chat.log", CHAT_LOG_FORMAT))
+        listeners.append(listener)
+
+        chat_logger.addHandler(chat_handler)
+        chat_logger.setLevel(logging.DEBUG)
+
+    for listener in listeners:
+        listener.start()
+
+    try:
+        client.run(client.get_token(), bot=True)
+    finally:
+        for listener in listeners:
+            listener.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+# coding=utf-8
+import datetime
+import logging
+
+import asyncio
+import discord
+
+from aiohttp import ServerDisconnectedError
+
+from bot.metrics import metrics
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Clearer")
+
+# Discord refuses to bulk-delete messages older than two weeks; we leave a little leeway for clock drift and for
+# the time it takes us to work through a batch
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=10)
+BULK_DELETE_MIN = 2
+BULK_DELETE_MAX = 100
+
+MAX_CONCURRENT_DELETES = 5
+MAX_ERRORS = 5
+
+
+class ClearResult:
+    def __init__(self):
+        self.seen = 0
+        self.bulk_deleted = 0
+        self.single_deleted = 0
+        self.failed = 0
+
+    @property
+    def deleted(self):
+        return self.bulk_deleted + self.single_deleted
+
+    def __str__(self):
+        return "`{}` messages removed".format(self.deleted)
+
+
+class ChannelClearer:
+    def __init__(self, client):
+        self.client = client
+
+    async def clear(self, channel, progress=None) -> ClearResult:
+        # `progress` may be a coroutine function; it's called with the running result after every batch
+
+        result = ClearResult()
+        before = None
+        num_errors = 0
+
+        while num_errors < MAX_ERRORS:
+            try:
+                batch = await self.fetch_batch(channel, before)
+            except (ServerDisconnectedError, discord.HTTPException) as e:
+                log.warning("Failed to fetch messages from channel {}: {}".format(channel.id, e))
+                num_errors += 1
+                continue
+
+            if not batch:
+                break
+
+            num_errors = 0
+            before = batch[-1]
+            result.seen += len(batch)
+
+            cutoff = datetime.datetime.utcnow() - BULK_DELETE_MAX_AGE
+
+            young = [message for message in batch if message.timestamp > cutoff]
+            old = [message for message in batch if message.timestamp <= cutoff]
+
+            if len(young) >= BULK_DELETE_MIN:
+                try:
+                    await self.client.scheduler.delete_messages(young)
+                except (discord.ClientException, discord.HTTPException) as e:
+                    log.warning("Bulk deletion failed in channel {}, deleting singly: {}".format(channel.id, e))
+                    old.extend(young)
+                else:
+                    result.bulk_deleted += len(young)
+            else:
+                old.extend(young)
+
+            if old:
+                await self.delete_singly(old, result)
+
+            if progress:
+                await progress(result)
+
+        return result
+
+    async def fetch_batch(self, channel, before):
+        batch = []
+        metrics.increment("api_calls_total", method="logs_from", server=channel.server.id)
+
+        async for message in self.client.logs_from(channel, limit=BULK_DELETE_MAX, before=before):
+            batch.append(message)
+
+        return batch
+
+    async def delete_singly(self, messages, result):
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DELETES)
+
+        async def delete(message):
+            async with semaphore:
+                try:
+                    await self.client.scheduler.delete_message(message)
+                except discord.NotFound:
+                    pass  # Already gone, which is what we wanted anyway
+                except Exception as e:
+                    log.debug("Failed to delete message {}: {}".format(message.id, e))
+                    result.failed += 1
+                    return
+
+                result.single_deleted += 1
+
+        await asyncio.gather(*[delete(message) for message in messages])
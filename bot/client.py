@@ -1,28 +1,38 @@
 # coding=utf-8
-import datetime
 import io
 import logging
+import random
 import re
 import shlex
-import traceback
+import time
 
-import asyncio
 import discord
 
-from aiohttp import ServerDisconnectedError, ClientSession
 from discord import Embed, Colour
 from ruamel import yaml
 
-from bot.data import DataManager
+from bot.clearer import ChannelClearer, ClearResult
+from bot.commands import command, CommandRegistry, MANAGE_MESSAGES, MANAGE_SERVER, OWNER
+from bot.data import DataManager, DEFAULT_SAVE_DELAY, STORAGE_BACKENDS
+from bot.gist_cache import GistCache, DEFAULT_MAX_ENTRIES as GIST_CACHE_SIZE, DEFAULT_TTL as GIST_CACHE_TTL
+from bot.http_pool import HTTPPool, DEFAULT_LIMIT, DEFAULT_LIMIT_PER_HOST
 from bot.interpreter import Interpreter
+from bot.metrics import metrics, format_counts, format_timers, server_id, MetricsServer
+from bot.prefix import PrefixMatcher
+from bot.publisher import Publisher
+from bot.scheduler import SendScheduler
+from bot.url_cache import (
+    URLCache, DEFAULT_MAX_PAGE_SIZE, DEFAULT_MAX_SIZE as URL_CACHE_SIZE, DEFAULT_TTL as URL_CACHE_TTL
+)
+from bot.utils import iter_chunks
 
 log = logging.getLogger("bot")
+chat_log = logging.getLogger("Chat")
 
 __author__ = 'Gareth Coles'
 
 GIST_CREATE_URL = "https://api.github.com/gists"
-GIST_URL = "https://api.github.com/gists/{}"
-GIST_REGEX = re.compile(r"gist:[a-z0-9]+")
+GIST_REGEX = re.compile(r"gist:([a-z0-9]+)(?:/([a-z0-9]+))?$")
 
 LOG_COLOURS = {
     logging.INFO: Colour.blue(),
@@ -32,7 +42,8 @@ LOG_COLOURS = {
 }
 
 CONFIG_KEY_DESCRIPTIONS = {
-    "control_chars": "Characters that all commands must be prefixed with. You can always mention me as well instead.",
+    "control_chars": "Characters that all commands must be prefixed with - give several to accept any of them. You "
+                     "can always mention me as well instead.",
     "info_channel": "ID for the currently-configured info channel. Use the `setup` command if you want to change this.",
     "notes_channel": "ID for the currently-configured notes channel. Use the `setup` command if you want to change this."
 }
@@ -57,19 +68,58 @@ To read up on how to use me, you should really take a look at our documentation
 """
 
 
+def format_config_value(value) -> str:
+    if isinstance(value, list):
+        return ", ".join("`{}`".format(item) for item in value)
+
+    return "`{}`".format(value)
+
+
 class Client(discord.client.Client):
     def __init__(self, *, loop=None, **options):
         super().__init__(loop=loop, **options)
 
         self.banned_ids = []
         self.config = yaml.safe_load(open("config.yml", "r"))
-        self.data_manager = DataManager()
+        self.data_manager = DataManager(
+            loop=self.loop, backend=self.get_storage_backend(),
+            save_delay=self.config.get("save_delay", DEFAULT_SAVE_DELAY),
+            load_workers=self.config.get("load_workers"), lazy=self.config.get("lazy_load", False)
+        )
         self.interpreter = Interpreter(locals(), self)
+        self.clearer = ChannelClearer(self)
+        self.publisher = Publisher(self)
+        self.scheduler = SendScheduler(self)
+
+        self.http_pool = HTTPPool(
+            self.loop, limit=self.config.get("http_pool_limit", DEFAULT_LIMIT),
+            limit_per_host=self.config.get("http_pool_limit_per_host", DEFAULT_LIMIT_PER_HOST)
+        )
+        self.gist_cache = GistCache(
+            self.http_pool, self.loop, ttl=self.config.get("gist_cache_ttl", GIST_CACHE_TTL),
+            max_entries=self.config.get("gist_cache_size", GIST_CACHE_SIZE)
+        )
+        self.url_cache = URLCache(
+            ttl=self.config.get("url_cache_ttl", URL_CACHE_TTL),
+            max_size=self.config.get("url_cache_max_size", URL_CACHE_SIZE),
+            max_page_size=self.config.get("url_max_page_size", DEFAULT_MAX_PAGE_SIZE)
+        )
+
+        self.commands = CommandRegistry(self)
+        self.prefix_matchers = {}  # Server ID -> PrefixMatcher, rebuilt when control_chars changes
+        self.metrics_server = None
+
+        self.chat_log_enabled = self.config.get("chat_log", False)
+        self.chat_log_sample_rate = self.config.get("chat_log_sample_rate", 1.0)
 
     def get_token(self):
         return self.config["token"]
 
-    def log_to_channel(self, record: logging.LogRecord):
+    def get_storage_backend(self):
+        backend = STORAGE_BACKENDS[self.config.get("storage", "yaml")]
+        return backend(**self.config.get("storage_options", {}))
+
+    async def log_to_channel(self, embed: Embed):
         if not self.config.get("log_channel"):
             return
 
@@ -78,50 +128,76 @@ class Client(discord.client.Client):
         if not channel:
             return
 
-        dt = datetime.datetime.fromtimestamp(
-            record.created
-        )
+        await self.scheduler.send_message(channel, embed=embed)
 
-        description = record.msg
+    async def close(self):
+        log.info("Shutting down...")
+        await self.data_manager.flush_async()
+        self.data_manager.close()
+        self.http_pool.close()
 
-        if record.exc_info:
-            description += "\n\n```{}```".format("\n".join(traceback.format_exception(*record.exc_info)))
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
 
-        embed = Embed(
-            title="{} / {}".format(record.name, record.levelname),
-            description=description
-        )
+        await discord.client.Client.close(self)
 
-        if record.levelno in LOG_COLOURS:
-            embed.colour = LOG_COLOURS[record.levelno]
+    # region API calls, counted per server and timed
 
-        embed.set_footer(text=dt.strftime("%B %d %Y, %H:%M:%S"))
+    async def send_message(self, destination, *args, **kwargs):
+        metrics.increment("api_calls_total", method="send_message", server=server_id(destination))
 
-        async def inner():
-            await self.send_message(channel, embed=embed)
+        with metrics.time("api_call_seconds", method="send_message"):
+            return await super().send_message(destination, *args, **kwargs)
 
-        self.loop.call_soon_threadsafe(asyncio.async, inner())
+    async def send_file(self, destination, *args, **kwargs):
+        metrics.increment("api_calls_total", method="send_file", server=server_id(destination))
 
-    async def close(self):
-        log.info("Shutting down...")
-        self.data_manager.save()
-        await discord.client.Client.close(self)
+        with metrics.time("api_call_seconds", method="send_file"):
+            return await super().send_file(destination, *args, **kwargs)
+
+    async def edit_message(self, message, *args, **kwargs):
+        metrics.increment("api_calls_total", method="edit_message", server=server_id(message))
+
+        with metrics.time("api_call_seconds", method="edit_message"):
+            return await super().edit_message(message, *args, **kwargs)
+
+    async def delete_message(self, message):
+        metrics.increment("api_calls_total", method="delete_message", server=server_id(message))
+
+        with metrics.time("api_call_seconds", method="delete_message"):
+            return await super().delete_message(message)
+
+    async def delete_messages(self, messages):
+        messages = list(messages)  # discord.py accepts any iterable
+        metrics.increment("api_calls_total", method="delete_messages", server=server_id(next(iter(messages), None)))
+
+        with metrics.time("api_call_seconds", method="delete_messages"):
+            return await super().delete_messages(messages)
+
+    # endregion
 
     def sections_updated(self, server):
-        self.data_manager.save_server(server.id)
+        self.data_manager.mark_dirty(server.id)
 
     async def on_ready(self):
         log.info("Setting up...")
-        self.data_manager.load()
+        await self.data_manager.load_async()
+
+        if self.config.get("metrics_port") and self.metrics_server is None:
+            self.metrics_server = MetricsServer(
+                self.loop, host=self.config.get("metrics_host", "127.0.0.1"), port=self.config["metrics_port"]
+            )
+
+            await self.metrics_server.start()
 
         for server in self.servers:
-            self.data_manager.add_server(server.id)
+            await self.data_manager.add_server_async(server.id)
 
         log.info("Ready!")
 
     async def on_server_join(self, server):
         log.info("Server joined: {} ({})\nOwner: {}".format(server.name, server.id, server.owner.name))
-        self.data_manager.add_server(server.id)
+        await self.data_manager.add_server_async(server.id)
 
         for message in WELCOME_MESSAGE:
             await self.send_message(server.default_channel, content=message)
@@ -130,106 +206,159 @@ class Client(discord.client.Client):
         if message.server is None:
             return  # DM
 
+        if self.chat_log_enabled:
+            self.log_chat(message)
+
+        # Most messages aren't for us, so this has to be as cheap as possible - no formatting or logging until we
+        # know it's a command
+        text = self.get_prefix_matcher(message.server).match(message.content)
+
+        if text is None:
+            return
+
         if message.author.id == self.user.id:
             return
 
         if str(message.author.discriminator) == "0000":  # Ignore webhooks and system messages
             return
 
-        logger = logging.getLogger(message.server.name)
+        if text:
+            if " " in text:
+                command_name, args = text.split(" ", 1)
+            else:
+                command_name = text
+                args = ""
 
-        user = "{}#{}".format(
-            message.author.name, message.author.discriminator
-        )
+            command = self.commands.get(command_name)
 
-        for line in message.content.split("\n"):
-            logger.debug("#{} / {} {}".format(
-                message.channel.name,
-                user, line
-            ))
+            if command is None:
+                return
 
-        chars = self.data_manager.get_server_command_chars(message.server)
-        text = None
+            # Check permissions before doing any real work - parsing, loading data or fetching gists
+            if not self.check_permission(message.author, command.permission):
+                return log.debug("Permission denied")  # No perms
 
-        if message.content.startswith(chars):  # It's a command
-            text = message.content[len(chars):].strip()
-        elif message.content.startswith(self.user.mention):
-            text = message.content[len(self.user.mention):].strip()
+            remaining = self.commands.cooldown_remaining(command, message.server.id)
 
-        if text:
-            if " " in text:
-                command, args = text.split(" ", 1)
-            else:
-                command = text
-                args = ""
+            if remaining:
+                return await self.send_message(
+                    message.channel, "{} Please wait `{}` seconds before using `{}` again".format(
+                        message.author.mention, int(remaining) + 1, command.name
+                    )
+                )
 
-            args_string = args
-            args = shlex.split(args)
+            # The cooldown starts now, so that a second use can't begin while this one is still running - unless
+            # this one never gets to run
+            self.commands.mark_used(command, message.server.id)
 
-            if len(args) > 0:
-                data = args[0:]
+            try:
+                ran = await self.run_command(command, args, message)
+            except Exception:
+                self.commands.clear_used(command, message.server.id)
+                raise
 
-                if GIST_REGEX.match(data[-1]):
-                    gist_id = data.pop(-1).split(":")[1]
-                    gist_url = GIST_URL.format(gist_id)
+            if not ran:
+                self.commands.clear_used(command, message.server.id)
 
-                    log.debug("Grabbing gist info: {}".format(gist_id))
+    async def run_command(self, command, args, message) -> bool:
+        # Parses the arguments, collects any gist, and runs the command. Returns False if it never got as far as
+        # running.
 
-                    session = ClientSession()
+        await self.data_manager.ensure_loaded(message.server.id)
 
-                    async with session.get(gist_url) as response:
-                        gist_json = await response.json()
+        args_string = args
+        args = shlex.split(args)
 
-                    session.close()
+        if len(args) > 0:
+            data = args[0:]
 
-                    if "files" not in gist_json:
-                        return await self.send_message(
-                            message.channel, "{} No such gist: `{}`".format(message.author.mention, gist_id)
-                        )
+            gist_match = GIST_REGEX.match(data[-1])
 
-                    for filename, file in gist_json["files"].items():
-                        log.debug("Gist file collected: {}".format(filename))
-                        data.append(file["content"])
-            else:
-                data = []
+            if gist_match:
+                data.pop(-1)
+                gist_id, revision = gist_match.groups()
 
-            log.debug("Command: {}".format(repr(command)))
-            log.debug("Args: {}".format(repr(args)))
-            log.debug("Args string: {}".format(repr(args_string)))
-            log.debug("Data: {}".format(repr(data)))
+                files = await self.gist_cache.get(gist_id, revision)
+                log.debug("Gist cache: {}".format(self.gist_cache))
 
-            if hasattr(self, "command_{}".format(command.replace("-", "_"))):
-                await getattr(self, "command_{}".format(command.replace("-", "_")))(data, args_string, message)
+                if files is None:
+                    await self.send_message(
+                        message.channel, "{} No such gist: `{}`".format(message.author.mention, gist_id)
+                    )
 
-    async def clear_channel(self, channel):
-        current_index = None
-        last_index = None
-        num_errors = 0
+                    return False
 
-        while current_index != -1:
-            if num_errors >= 5:
-                break
+                for filename, content in files:
+                    log.debug("Gist file collected: {}".format(filename))
+                    data.append(content)
+        else:
+            data = []
 
-            try:
-                async for message in self.logs_from(channel, before=current_index):
-                    current_index = message
-                    await self.delete_message(message)
-            except ServerDisconnectedError:
-                try:
-                    async for message in self.logs_from(channel, before=current_index):
-                        current_index = message
-                        await self.delete_message(message)
-                except Exception:
-                    num_errors += 1
-                    continue
-            except Exception:
-                num_errors += 1
-                continue
+        log.debug("Command: {}".format(repr(command.name)))
+        log.debug("Args: {}".format(repr(args)))
+        log.debug("Args string: {}".format(repr(args_string)))
+        log.debug("Data: {}".format(repr(data)))
+
+        metrics.increment("commands_total", command=command.name, server=message.server.id)
+
+        try:
+            with metrics.time("command_seconds", command=command.name):
+                await command.func(data, args_string, message)
+        except Exception:
+            metrics.increment("command_errors_total", command=command.name)
+            raise
 
-            if last_index == current_index:
-                break
+        return True
 
-            last_index = current_index
+    def get_prefix_matcher(self, server) -> PrefixMatcher:
+        matcher = self.prefix_matchers.get(server.id)
+
+        if matcher is None:
+            matcher = PrefixMatcher(self.data_manager.get_server_prefixes(server), self.user.id)
+            self.prefix_matchers[server.id] = matcher
+
+        return matcher
+
+    def log_chat(self, message):
+        # Opt-in, with `chat_log` in the config - and sampled, so busy servers don't drown out everything else
+
+        if not chat_log.isEnabledFor(logging.DEBUG):
+            return
+
+        if self.chat_log_sample_rate < 1 and random.random() >= self.chat_log_sample_rate:
+            return
+
+        user = "{}#{}".format(
+            message.author.name, message.author.discriminator
+        )
+
+        for line in message.content.split("\n"):
+            chat_log.debug("{} #{} / {} {}".format(
+                message.server.name, message.channel.name,
+                user, line
+            ))
+
+    async def clear_channel(self, channel, progress=None) -> ClearResult:
+        with metrics.time("clear_channel_seconds"):
+            result = await self.clearer.clear(channel, progress=progress)
+
+        log.debug("Cleared channel {}: {} bulk-deleted, {} deleted singly, {} failed".format(
+            channel.id, result.bulk_deleted, result.single_deleted, result.failed
+        ))
+
+        return result
+
+    def check_permission(self, user, permission) -> bool:
+        if permission is None:
+            return True
+        elif permission == OWNER:
+            return int(user.id) == int(self.config["owner_id"])
+        elif permission == MANAGE_SERVER:
+            return self.has_permission(user)
+        elif permission == MANAGE_MESSAGES:
+            return self.has_permission_notes(user)
+
+        raise ValueError("Unknown permission: {}".format(permission))
 
     def has_permission(self, user):
         if user.server_permissions.manage_server:
@@ -274,10 +403,8 @@ class Client(discord.client.Client):
 
     # region Commands
 
+    @command(permission=OWNER)
     async def command_eval(self, data, data_string, message):
-        if int(message.author.id) != int(self.config["owner_id"]):
-            return
-
         code = data_string.strip(" ")
 
         if code.startswith("```") and code.endswith("```"):
@@ -322,17 +449,15 @@ class Client(discord.client.Client):
                 message.channel, out_message
             )
 
+    @command(permission=MANAGE_SERVER)
     async def command_config(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             config = self.data_manager.get_config(message.server)
 
             md = "__**Current configuration**__\n\n"
 
             for key, value in config.items():
-                md += "**{}**: `{}`\n".format(key, value)
+                md += "**{}**: {}\n".format(key, format_config_value(value))
 
             await self.send_message(
                 message.channel, "{}\n\n{}".format(message.author.mention, md)
@@ -348,14 +473,17 @@ class Client(discord.client.Client):
                 )
 
             await self.send_message(
-                message.channel, "{} **{}** is set to `{}`\n\n**Info**: {}".format(
-                    message.author.mention, key, config[key], CONFIG_KEY_DESCRIPTIONS[key]
+                message.channel, "{} **{}** is set to {}\n\n**Info**: {}".format(
+                    message.author.mention, key, format_config_value(config[key]), CONFIG_KEY_DESCRIPTIONS[key]
                 )
             )
         else:
             config = self.data_manager.get_config(message.server)
             key, value = data[0].lower(), data[1]
 
+            if key == "control_chars" and len(data) > 2:
+                value = data[1:]  # Several prefixes
+
             if key == "info_channel":
                 return await self.send_message(
                     message.channel, "{} Please use the `setup` command to change the info channel instead.".format(
@@ -376,18 +504,19 @@ class Client(discord.client.Client):
                 )
 
             self.data_manager.set_config(message.server, key, value)
-            self.data_manager.save_server(message.server.id)
+            self.data_manager.mark_dirty(message.server.id)
+
+            if key == "control_chars":
+                self.prefix_matchers.pop(message.server.id, None)
 
             await self.send_message(
-                message.channel, "{} **{}** is now set to `{}`".format(
-                    message.author.mention, key, value
+                message.channel, "{} **{}** is now set to {}".format(
+                    message.author.mention, key, format_config_value(value)
                 )
             )
 
+    @command(permission=MANAGE_SERVER, aliases=("add",))
     async def command_create(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 2:
             return await self.send_message(
                 message.channel, "{} Usage: `create <section type> \"<section name>\"`".format(message.author.mention)
@@ -413,7 +542,7 @@ class Client(discord.client.Client):
 
         section = clazz(section_name)
         self.data_manager.add_section(message.server, section)
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -422,13 +551,50 @@ class Client(discord.client.Client):
             )
         )
 
+    @command(permission=OWNER)
+    async def command_stats(self, data, data_string, message):
+        uptime = int(time.time() - metrics.started)
+        server = message.server.id
+
+        lines = ["Uptime: {}d {}h {}m".format(uptime // 86400, uptime % 86400 // 3600, uptime % 3600 // 60)]
+
+        for title, stats in [
+            ("Commands", format_timers(metrics.timing("command_seconds", by=("command",)))),
+            ("Commands on this server", format_counts(
+                metrics.count("commands_total", by=("command",), server=server)
+            )),
+            ("API calls", format_timers(metrics.timing("api_call_seconds", by=("method",)))),
+            ("API calls on this server", format_counts(
+                metrics.count("api_calls_total", by=("method",), server=server)
+            )),
+            ("Section renders", format_timers(metrics.timing("section_render_seconds", by=("type",)))),
+            ("Publishing", format_timers(metrics.timing("publish_seconds", by=("mode",)))),
+            ("Channel clears", format_timers(metrics.timing("clear_channel_seconds"))),
+            ("Saves", format_timers(metrics.timing("save_seconds"))),
+        ]:
+            if stats:
+                lines.append("\n{}".format(title))
+                lines.extend(stats)
+
+        lines.append("\nServers saved: {}, save errors: {}, command errors: {}".format(
+            sum(metrics.count("servers_saved_total").values()), sum(metrics.count("save_errors_total").values()),
+            sum(metrics.count("command_errors_total").values())
+        ))
+        lines.append("Gist cache: {}".format(self.gist_cache))
+        lines.append("URL cache: {} cached, {} hits, {} misses, {} revalidated, {} served stale".format(
+            len(self.url_cache), self.url_cache.hits, self.url_cache.misses, self.url_cache.revalidated,
+            self.url_cache.stale
+        ))
+
+        for chunk in iter_chunks(lines, 1990):
+            await self.send_message(message.channel, "```\n{}\n```".format(chunk))
+
+    @command()
     async def command_help(self, data, data_string, message):
         await self.send_message(message.channel, "{}\n\n{}".format(message.author.mention, HELP_MESSAGE))
 
+    @command(permission=MANAGE_SERVER, aliases=("delete",))
     async def command_remove(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             return await self.send_message(
                 message.channel, "{} Usage: `remove \"<section name>\"`".format(message.author.mention)
@@ -443,7 +609,7 @@ class Client(discord.client.Client):
             )
 
         self.data_manager.remove_section(message.server, section_name)
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -453,10 +619,8 @@ class Client(discord.client.Client):
             )
         )
 
+    @command(permission=MANAGE_SERVER)
     async def command_section(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         try:
             section_name, command = data[0], data[1]
 
@@ -495,10 +659,8 @@ class Client(discord.client.Client):
         else:
             return await self.send_message(message.channel, content="{} {}".format(message.author.mention, result))
 
+    @command(permission=MANAGE_SERVER)
     async def command_setup(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) > 1:
             return await self.send_message(
                 message.channel,
@@ -520,6 +682,7 @@ class Client(discord.client.Client):
             )
 
         self.data_manager.set_channel(message.server, channel)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -528,10 +691,8 @@ class Client(discord.client.Client):
                     "YOU SELECTED THE CORRECT CHANNEL!*__**".format(message.author.mention, channel.mention)
         )
 
+    @command(permission=MANAGE_SERVER, cooldown=30)
     async def command_show(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         await self.send_message(
             message.channel, "{} Just a moment, collecting and uploading data...".format(message.author.mention)
         )
@@ -551,10 +712,13 @@ Command Breakdown
         markdown = []
         commands = []
 
-        sections = self.data_manager.get_sections(message.server)
-        chars = self.data_manager.get_server_command_chars(message.server)
+        sections = list(self.data_manager.get_sections(message.server))
+        prefixes = self.data_manager.get_server_prefixes(message.server)
+        chars = prefixes[0] if prefixes else "{} ".format(self.user.mention)
 
-        for name, section in sections:
+        rendered = await self.publisher.render_sections([section for _, section in sections])
+
+        for (name, section), lines in zip(sections, rendered):
             markdown_set = ["**__{}__**".format(name)]
             command_set = ["add {} \"{}\"".format(section._type, name)]
 
@@ -565,7 +729,7 @@ Command Breakdown
             for x in await section.show():
                 command_set.append(x)
 
-            for part in await section.render():
+            for part in lines:
                 markdown_set.append(part)
 
             if section.get_footer():
@@ -599,10 +763,8 @@ Command Breakdown
             content="{} Here's the data you requested.".format(message.author.mention)
         )
 
+    @command(permission=MANAGE_SERVER, aliases=("publish",), cooldown=10)
     async def command_update(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         channel = self.data_manager.get_channel(message.server)
 
         if not channel:
@@ -623,37 +785,18 @@ Command Breakdown
                 )
             )
 
-        await self.clear_channel(channel)
-
-        sections = self.data_manager.get_sections(message.server)
-
-        for name, section in sections:
-            await self.send_message(channel, "**__{}__**".format(name))
-            await asyncio.sleep(0.2)
-
-            if section.get_header():
-                await self.send_message(channel, section.get_header())
-                await asyncio.sleep(0.2)
-
-            for part in await section.render():
-                await self.send_message(channel, part)
-                await asyncio.sleep(0.2)
-
-            if section.get_footer():
-                await self.send_message(channel, section.get_footer())
-                await asyncio.sleep(0.2)
+        full = len(data) > 0 and data[0].lower() == "full"
+        result = await self.publisher.publish(message.server, channel, full=full)
 
         await self.send_message(
             message.channel,
-            "{} The info channel has been updated!".format(
-                message.author.mention
+            "{} The info channel has been updated! ({})".format(
+                message.author.mention, result
             )
         )
 
+    @command(permission=MANAGE_SERVER)
     async def command_swap(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 2:
             return await self.send_message(
                 message.channel, "{} Usage: `swap \"<section name>\" \"<section name>\"`".format(message.author.mention)
@@ -674,7 +817,7 @@ Command Breakdown
             )
 
         self.data_manager.swap_sections(message.server, left, right)
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -684,18 +827,46 @@ Command Breakdown
             )
         )
 
-    async def command_header(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
+    @command(permission=MANAGE_SERVER)
+    async def command_rename(self, data, data_string, message):
+        if len(data) < 2:
+            return await self.send_message(
+                message.channel, "{} Usage: `rename \"<section name>\" \"<new name>\"`".format(message.author.mention)
+            )
+
+        old_name, new_name = data[0], data[1]
+
+        if not self.data_manager.has_section(message.server, old_name):
+            return await self.send_message(
+                message.channel, "{} No such section: `{}`\n\nPerhaps you meant to surround the section name with "
+                                 "\"quotes\"?".format(message.author.mention, old_name)
+            )
+
+        if not self.data_manager.rename_section(message.server, old_name, new_name):
+            return await self.send_message(
+                message.channel, "{} A section named `{}` already exists".format(message.author.mention, new_name)
+            )
+
+        self.data_manager.mark_dirty(message.server.id)
 
+        await self.send_message(
+            message.channel,
+            "{} Section renamed: `{}` is now `{}`\n\nRun the `update` command to update the info channel.".format(
+                message.author.mention, old_name, new_name
+            )
+        )
+
+    @command(permission=MANAGE_SERVER)
+    async def command_header(self, data, data_string, message):
         if len(data) < 2:
             return await self.send_message(
                 message.channel, "{} Usage: `header \"<section name>\" \"<data>\"`".format(message.author.mention)
             )
 
         section_name, header = data[0], data[1]
+        section = self.data_manager.get_section(message.server, section_name)
 
-        if not self.data_manager.get_section(message.server, section_name):
+        if not section:
             return await self.send_message(
                 message.channel, "{} No such section: `{}`\n\nPerhaps you meant to surround the section name with "
                                  "\"quotes\"?".format(message.author.mention, section_name)
@@ -706,7 +877,8 @@ Command Breakdown
                 message.channel, "{} Section header must be less than 2000 characters in length"
             )
 
-        self.data_manager.get_section(message.server, section_name).set_header(header)
+        section.set_header(header)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -716,18 +888,17 @@ Command Breakdown
             )
         )
 
+    @command(permission=MANAGE_SERVER)
     async def command_footer(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 2:
             return await self.send_message(
                 message.channel, "{} Usage: `footer \"<section name>\" \"<data>\"`".format(message.author.mention)
             )
 
         section_name, footer = data[0], data[1]
+        section = self.data_manager.get_section(message.server, section_name)
 
-        if not self.data_manager.get_section(message.server, section_name):
+        if not section:
             return await self.send_message(
                 message.channel, "{} No such section: `{}`\n\nPerhaps you meant to surround the section name with "
                                  "\"quotes\"?".format(message.author.mention, section_name)
@@ -738,7 +909,8 @@ Command Breakdown
                 message.channel, "{} Section footer must be less than 2000 characters in length"
             )
 
-        self.data_manager.get_section(message.server, section_name).set_footer(footer)
+        section.set_footer(footer)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -750,10 +922,8 @@ Command Breakdown
 
     # Notes commands
 
+    @command(permission=MANAGE_SERVER)
     async def command_setup_notes(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) > 1:
             return await self.send_message(
                 message.channel,
@@ -775,6 +945,7 @@ Command Breakdown
             )
 
         self.data_manager.set_notes_channel(message.server, channel)
+        self.data_manager.mark_dirty(message.server.id)
 
         await self.send_message(
             message.channel,
@@ -783,10 +954,8 @@ Command Breakdown
                                                                                         channel.mention)
         )
 
+    @command(permission=MANAGE_SERVER, cooldown=10)
     async def command_update_notes(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         channel = self.data_manager.get_notes_channel(message.server)
 
         if not channel:
@@ -807,28 +976,28 @@ Command Breakdown
                 )
             )
 
-        await self.clear_channel(channel)
+        cleared = await self.clear_channel(channel)
 
         notes = self.data_manager.get_notes(message.server)
 
         for index, note in notes.items():
-            sent_message = await self.send_message(
+            sent_message = await self.scheduler.send_message(
                 channel, embed=self.create_note_embed(message.server, note, index)
             )
 
             note["message_id"] = sent_message.id
 
+        self.data_manager.mark_dirty(message.server.id)
+
         await self.send_message(
             message.channel,
-            "{} The notes channel has been updated!".format(
-                message.author.mention
+            "{} The notes channel has been updated! ({})".format(
+                message.author.mention, cleared
             )
         )
 
+    @command(permission=MANAGE_MESSAGES)
     async def command_note(self, data, data_string, message):
-        if not self.has_permission_notes(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             return await self.send_message(
                 message.channel, "{} Usage: `note \"<text>\"`".format(message.author.mention)
@@ -837,12 +1006,12 @@ Command Breakdown
         text = data[0]
 
         index, note = self.data_manager.create_note(message.server, message, text)
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         channel = self.data_manager.get_notes_channel(message.server)
 
         if channel:
-            sent_message = await self.send_message(
+            sent_message = await self.scheduler.send_message(
                 self.get_channel(channel),
                 embed=self.create_note_embed(message.server, note, index)
             )
@@ -864,10 +1033,8 @@ Command Breakdown
                 )
             )
 
+    @command(permission=MANAGE_MESSAGES)
     async def command_reopen(self, data, data_string, message):
-        if not self.has_permission_notes(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             return await self.send_message(
                 message.channel, "{} Usage: `reopen \"<note number>\"`".format(message.author.mention)
@@ -888,7 +1055,7 @@ Command Breakdown
             )
 
         note["status"] = "open"
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         channel = self.data_manager.get_notes_channel(message.server)
 
@@ -907,7 +1074,7 @@ Command Breakdown
                     )
                 )
 
-            await self.edit_message(
+            await self.scheduler.edit_message(
                 note_message, embed=self.create_note_embed(message.server, note, index)
             )
 
@@ -926,10 +1093,8 @@ Command Breakdown
                 )
             )
 
+    @command(permission=MANAGE_MESSAGES)
     async def command_resolve(self, data, data_string, message):
-        if not self.has_permission_notes(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             return await self.send_message(
                 message.channel, "{} Usage: `resolve \"<note number>\"`".format(message.author.mention)
@@ -950,7 +1115,7 @@ Command Breakdown
             )
 
         note["status"] = "resolved"
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         channel = self.data_manager.get_notes_channel(message.server)
 
@@ -969,7 +1134,7 @@ Command Breakdown
                     )
                 )
 
-            await self.edit_message(
+            await self.scheduler.edit_message(
                 note_message, embed=self.create_note_embed(message.server, note, index)
             )
 
@@ -988,10 +1153,8 @@ Command Breakdown
                 )
             )
 
+    @command(permission=MANAGE_MESSAGES)
     async def command_close(self, data, data_string, message):
-        if not self.has_permission_notes(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             return await self.send_message(
                 message.channel, "{} Usage: `close \"<note number>\"`".format(message.author.mention)
@@ -1012,7 +1175,7 @@ Command Breakdown
             )
 
         note["status"] = "closed"
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         channel = self.data_manager.get_notes_channel(message.server)
 
@@ -1031,7 +1194,7 @@ Command Breakdown
                     )
                 )
 
-            await self.edit_message(
+            await self.scheduler.edit_message(
                 note_message, embed=self.create_note_embed(message.server, note, index)
             )
 
@@ -1050,10 +1213,8 @@ Command Breakdown
                 )
             )
 
+    @command(permission=MANAGE_MESSAGES, aliases=("edit-note",))
     async def command_note_edit(self, data, data_string, message):
-        if not self.has_permission_notes(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 2:
             return await self.send_message(
                 message.channel, "{} Usage: `note-edit \"<note number>\" \"<text>\"`".format(message.author.mention)
@@ -1075,7 +1236,7 @@ Command Breakdown
                 )
 
         note["text"] = text
-        self.data_manager.save_server(message.server.id)
+        self.data_manager.mark_dirty(message.server.id)
 
         channel = self.data_manager.get_notes_channel(message.server)
 
@@ -1094,7 +1255,7 @@ Command Breakdown
                     )
                 )
 
-            await self.edit_message(
+            await self.scheduler.edit_message(
                 note_message, embed=self.create_note_embed(message.server, note, index)
             )
 
@@ -1113,10 +1274,8 @@ Command Breakdown
                 )
             )
 
+    @command(permission=MANAGE_SERVER, aliases=("delete-note",))
     async def command_note_delete(self, data, data_string, message):
-        if not self.has_permission(message.author):
-            return log.debug("Permission denied")  # No perms
-
         if len(data) < 1:
             return await self.send_message(
                 message.channel, "{} Usage: `note-delete \"<note number>\"`".format(message.author.mention)
@@ -1132,7 +1291,7 @@ Command Breakdown
             )
 
         self.data_manager.delete_note(message.server, index)
-        self.data_manager.save_server(message.server)
+        self.data_manager.mark_dirty(message.server.id)
 
         channel = self.data_manager.get_notes_channel(message.server)
 
@@ -1152,11 +1311,6 @@ Command Breakdown
             )
         )
 
-    # Aliases
-
-    command_add = command_create
-    command_delete = command_remove
-
 # endregion
 
     pass
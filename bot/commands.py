@@ -0,0 +1,101 @@
+# coding=utf-8
+import time
+
+from typing import Optional
+
+__author__ = "Gareth Coles"
+
+# Permission levels, checked by Client.check_permission before a command's arguments are even parsed
+OWNER = "owner"
+MANAGE_SERVER = "manage_server"
+MANAGE_MESSAGES = "manage_messages"
+
+
+class Command:
+    def __init__(self, name, func, aliases=(), permission=None, cooldown=0):
+        self.name = name
+        self.func = func
+        self.aliases = tuple(aliases)
+        self.permission = permission
+        self.cooldown = cooldown  # Seconds between uses, per server
+
+
+def command(name=None, aliases=(), permission=None, cooldown=0):
+    # Marks a Client method as a command. The name defaults to the method name without its `command_` prefix, and
+    # with dashes instead of underscores - so `command_note_edit` is the `note-edit` command.
+
+    def decorator(func):
+        command_name = name or func.__name__[len("command_"):].replace("_", "-")
+        func.command = Command(command_name, func, aliases=aliases, permission=permission, cooldown=cooldown)
+
+        return func
+
+    return decorator
+
+
+class CommandRegistry:
+    # Built once at startup from the decorated methods on the client, so dispatching a message is a single dict
+    # lookup instead of building and checking attribute names every time.
+
+    def __init__(self, client):
+        self.commands = {}  # name or alias -> Command, bound to the client
+        self.last_used = {}  # (command name, server ID) -> time of last use
+
+        seen = set()
+
+        for attr in dir(type(client)):
+            info = getattr(getattr(type(client), attr), "command", None)
+
+            if isinstance(info, Command) and info not in seen:
+                # The same method may be assigned to more than one attribute; use `aliases` for extra names
+                seen.add(info)
+
+                self.register(Command(
+                    info.name, getattr(client, attr), aliases=info.aliases, permission=info.permission,
+                    cooldown=info.cooldown
+                ))
+
+    @staticmethod
+    def key(name) -> str:
+        return name.lower().replace("_", "-")
+
+    def register(self, command: Command):
+        for name in (command.name,) + command.aliases:
+            key = self.key(name)
+
+            if key in self.commands:
+                raise ValueError("Duplicate command name or alias: {}".format(name))
+
+            self.commands[key] = command
+
+    def get(self, name) -> Optional[Command]:
+        return self.commands.get(self.key(name))
+
+    def __contains__(self, name):
+        return self.key(name) in self.commands
+
+    def cooldown_remaining(self, command: Command, server_id) -> float:
+        # Returns how many seconds are left before the command may be used on this server again
+
+        if not command.cooldown:
+            return 0
+
+        now = time.monotonic()
+        last_used = self.last_used.get((command.name, server_id))
+
+        if last_used is not None and now - last_used < command.cooldown:
+            return command.cooldown - (now - last_used)
+
+        return 0
+
+    def mark_used(self, command: Command, server_id):
+        # Starts the command's cooldown on this server - as soon as it's dispatched, so a second use can't start
+        # while the first is still running
+
+        if command.cooldown:
+            self.last_used[(command.name, server_id)] = time.monotonic()
+
+    def clear_used(self, command: Command, server_id):
+        # Ends the cooldown early, for a command that never got to run - a bad gist shouldn't lock anyone out
+
+        self.last_used.pop((command.name, server_id), None)
@@ -1,18 +1,24 @@
 # coding=utf-8
+import copy
 import datetime
 import logging
-import os
-import re
 
-from ruamel import yaml
+import asyncio
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from typing import List, Union, Dict, Any
 
+from bot.metrics import metrics
+from bot.registry import Registry
 from bot.sections.base import BaseSection
 from bot.sections.bullet_list import BulletedListSection
 from bot.sections.faq import FAQSection
 from bot.sections.numbered_list import NumberedListSection
 from bot.sections.text import TextSection
 from bot.sections.url import URLSection
+from bot.storage.sqlite_backend import SQLiteBackend
+from bot.storage.yaml_backend import YAMLBackend
 
 __author__ = "Gareth Coles"
 
@@ -41,7 +47,12 @@ SECTION_TYPES = {
 
 SECTION_TYPES.update({v: k for k, v in SECTION_TYPES.items()})
 
-SECTION_REGEX = re.compile(r"[\d]+[\\/]?")
+STORAGE_BACKENDS = {
+    "yaml": YAMLBackend,
+    "sqlite": SQLiteBackend
+}
+
+DEFAULT_SAVE_DELAY = 5  # Seconds
 
 DEFAULT_CONFIG = {
     "control_chars": "!",
@@ -54,6 +65,11 @@ DEFAULT_NOTES = {
     "notes": {}
 }
 
+DEFAULT_PUBLISHED = {
+    "channel": None,
+    "messages": []
+}
+
 DEFAULT_SECTIONS = [
     ["Welcome Message", "text", TextSection("help", HELP_TEXT).to_dict()]
 ]
@@ -62,115 +78,234 @@ log = logging.getLogger("Data")
 
 
 class DataManager:
-    # data = {
-    #     server_id: {
-    #         sections: [
-    #             [name, object] (stored as name, type, data)
-    #         ]
-    #         config: {}
-    #     }
-    # }
-
-    data = {}
-
-    # notes = {
-    #     server_id: {
-    #         "number": 0,
-    #         "notes": {
-    #             "0": {
-    #                 "message_id": "0",
-    #                 "status": "open",
-    #                 "text": "",
-    #                 "submitted": "",
-    #                 "submitter": {
-    #                     "id": "0",
-    #                     "name": ""
-    #                 }
-    #             }
-    #     }
-    # }
-
-    notes = {}
-
-    def __init__(self):
-        if not os.path.exists("data"):
-            os.mkdir("data")
-
-    def load(self):
-        for fn in os.listdir("data/"):
-            if os.path.isdir("data/{}".format(fn)):
-                if SECTION_REGEX.match(fn):
-                    if fn[-1] in "\\/":
-                        fn = fn[:-1]
-
-                    try:
-                        self.load_server(fn)
-                    except Exception:
-                        log.exception("Failed to load server: {}".format(fn))
-
-    def save(self):
-        for server_id, data in self.data.items():
-            self.save_server(server_id, data)
+    def __init__(self, loop=None, backend=None, save_delay=DEFAULT_SAVE_DELAY, load_workers=None, lazy=False):
+        self.loop = loop or asyncio.get_event_loop()
+        self.backend = backend or YAMLBackend()
+        self.save_delay = save_delay
+
+        # data = {
+        #     server_id: {
+        #         sections: [
+        #             [name, object] (stored as name, type, data)
+        #         ]
+        #         config: {}
+        #     }
+        # }
+        self.data = {}
+
+        # notes = {
+        #     server_id: {
+        #         "number": 0,
+        #         "notes": {
+        #             "0": {
+        #                 "message_id": "0",
+        #                 "status": "open",
+        #                 "text": "",
+        #                 "submitted": "",
+        #                 "submitter": {
+        #                     "id": "0",
+        #                     "name": ""
+        #                 }
+        #             }
+        #     }
+        # }
+        self.notes = {}
+
+        # published = {
+        #     server_id: {
+        #         "channel": "0",
+        #         "messages": [
+        #             [message_id, digest]  # One per rendered chunk, in channel order
+        #         ]
+        #     }
+        # }
+        self.published = {}
+
+        self.load_workers = load_workers
+        self.lazy = lazy
+        self.unloaded = set()
+
+        self.dirty = set()
+        self.flush_handle = None
+
+        # All backend calls happen on this single worker, which keeps writes in order and the backends simple
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def load_async(self):
+        # Servers are parsed in parallel in a process pool, if the backend supports it. In lazy mode, we only read
+        # their configs up-front - sections, notes and published messages wait for the server's first command.
+
+        server_ids = await self.loop.run_in_executor(self.executor, self.backend.list_servers)
+
+        if self.backend.parallel:
+            pool = ProcessPoolExecutor(max_workers=self.load_workers)
+        else:
+            pool = self.executor
 
-    def save_server(self, server_id, data=None, notes=None):
-        if not data:
-            data = self.data[server_id]
+        try:
+            futures = [
+                self.loop.run_in_executor(pool, self.backend.read_raw, server_id, self.lazy)
+                for server_id in server_ids
+            ]
+
+            for server_id, future in zip(server_ids, futures):
+                try:
+                    loaded = self.backend.finish_read(server_id, await future)
+
+                    if loaded is None:
+                        continue
+
+                    if self.lazy:
+                        self.install_lazy_server(server_id, loaded[0])
+                    else:
+                        self.install_server(server_id, *loaded)
+                except Exception:
+                    log.exception("Failed to load server: {}".format(server_id))
+        finally:
+            if pool is not self.executor:
+                pool.shutdown()
+
+        log.info("Loaded {} servers{}".format(len(server_ids), " lazily" if self.lazy else ""))
+
+    def install_lazy_server(self, server_id, config):
+        if "notes_channel" not in config:
+            config["notes_channel"] = None
 
-        if not notes:
-            notes = self.notes[server_id]
+        self.data[server_id] = {
+            "config": config,
+            "sections": None
+        }
 
-        try:
-            if not os.path.exists("data/{}".format(server_id)):
-                self.add_server(server_id)
+        self.unloaded.add(server_id)
+
+    def is_loaded(self, server_id) -> bool:
+        return server_id in self.data and server_id not in self.unloaded
+
+    async def ensure_loaded(self, server_id):
+        if server_id not in self.unloaded:
+            return
 
-            with open("data/{}/config.yml".format(server_id), "w") as config_fh:
-                yaml.safe_dump(data["config"], config_fh)
+        loaded = await self.loop.run_in_executor(self.executor, self.backend.read_server, server_id)
 
-            with open("data/{}/notes.yml".format(server_id), "w") as notes_fh:
-                yaml.safe_dump(self.serialise_notes(notes), notes_fh)
+        if server_id not in self.unloaded:
+            return  # Someone else got here first while we were waiting
 
-            with open("data/{}/sections.yml".format(server_id), "w") as sections_fh:
-                yaml.safe_dump(self.serialise_sections(data["sections"]), sections_fh)
+        self.unloaded.discard(server_id)
+        config = self.data[server_id]["config"]  # May have been changed since we loaded it
+
+        if loaded is None:
+            # Its files have gone missing since startup; start it over rather than leaving it without sections
+            log.warning("No data found for lazily-loaded server {}; using the default sections".format(server_id))
+            self.install_server(server_id, config, copy.deepcopy(DEFAULT_SECTIONS), None, None)
+        else:
+            self.install_server(server_id, config, *loaded[1:])
+
+    def close(self):
+        self.executor.shutdown()
+        self.backend.close()
+
+    def mark_dirty(self, server_id):
+        # Changes are written out `save_delay` seconds after the first one since the last save, so a burst of edits
+        # results in a single write. The timer isn't pushed back by later edits, so a busy server still gets saved
+        # regularly.
+
+        self.dirty.add(server_id)
+
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(
+                self.save_delay, lambda: self.loop.create_task(self.flush_async())
+            )
+
+    def take_dirty(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    async def flush_async(self):
+        # Every dirty server is written in one go, so the backend can make the whole lot durable with a single
+        # batch of syncs. If that fails, they're all marked dirty again to be retried later.
+
+        dirty = self.take_dirty()
+
+        for server_id in dirty:
+            await self.ensure_loaded(server_id)
+
+        servers = {server_id: self.serialise_server(server_id) for server_id in dirty if server_id in self.data}
+
+        if not servers:
+            return
+
+        try:
+            with metrics.time("save_seconds"):
+                await self.loop.run_in_executor(self.executor, self.backend.write_servers, servers)
         except Exception:
-            log.exception("Error saving server '{}'".format(server_id))
+            metrics.increment("save_errors_total")
+            log.exception("Error saving servers: {}".format(", ".join(servers)))
 
-    def load_server(self, server_id) -> bool:
-        if not os.path.exists("data/{}".format(server_id)):
-            return False
+            for server_id in servers:
+                self.mark_dirty(server_id)
+        else:
+            metrics.increment("servers_saved_total", len(servers))
 
-        log.debug("Loading server: {}".format(server_id))
+    def serialise_server(self, server_id, data=None, notes=None) -> Dict[str, Any]:
+        # Everything is copied here, on the event loop, so that the backend can write it out on another thread
+        # while the originals carry on being edited
 
-        config = yaml.safe_load(open("data/{}/config.yml".format(server_id), "r"))
-        sections = yaml.safe_load(open("data/{}/sections.yml".format(server_id), "r"))
+        if not data:
+            data = self.data[server_id]
+
+        if not notes:
+            notes = self.notes[server_id]
+
+        return copy.deepcopy({
+            "config": data["config"],
+            "sections": self.serialise_sections(data["sections"]),
+            "notes": self.serialise_notes(notes),
+            "published": self.published[server_id]
+        })
 
-        if os.path.exists("data/{}/notes.yml".format(server_id)):
-            notes = yaml.safe_load(open("data/{}/notes.yml".format(server_id), "r"))
+    def save_server(self, server_id, data=None, notes=None):
+        try:
+            with metrics.time("save_seconds"):
+                self.backend.write_server(server_id, self.serialise_server(server_id, data, notes))
+        except Exception:
+            metrics.increment("save_errors_total")
+            log.exception("Error saving server '{}'".format(server_id))
         else:
-            notes = DEFAULT_NOTES
+            metrics.increment("servers_saved_total")
 
+    def install_server(self, server_id, config, sections, notes, published):
         if "notes_channel" not in config:
             config["notes_channel"] = None
 
+        if notes is None:
+            notes = copy.deepcopy(DEFAULT_NOTES)
+
+        if published is None:
+            published = copy.deepcopy(DEFAULT_PUBLISHED)
+
         self.data[server_id] = {
             "config": config,
             "sections": self.load_sections(sections)
         }
 
         self.notes[server_id] = notes
+        self.published[server_id] = published
 
-        return True
+    def load_sections(self, sections: List[Union[str, str, dict]]) -> Registry:
+        loaded_sections = Registry([
+            [name, SECTION_TYPES[section_type].from_dict(name, data)] for name, section_type, data in sections
+        ])
 
-    def load_sections(self, sections: List[Union[str, str, dict]]) -> List:
-        loaded_sections = []
-
-        for name, section_type, data in sections:
-            loaded_sections.append(
-                [name, SECTION_TYPES[section_type].from_dict(name, data)]
-            )
+        for name, section in loaded_sections:
+            section.name = name  # In case the registry had to rename it
 
         return loaded_sections
 
-    def serialise_sections(self, sections: List[Union[str, BaseSection]]) -> List:
+    def serialise_sections(self, sections: Registry) -> List:
         unloaded_sections = []
 
         for name, section in sections:
@@ -181,30 +316,26 @@ class DataManager:
     def serialise_notes(self, notes):
         return notes  # Future-proofing
 
-    def add_server(self, server_id) -> bool:
-        if os.path.exists("data/{}".format(server_id)):
-            return False
-
-        os.mkdir("data/{}".format(server_id))
-
-        with open("data/{}/config.yml".format(server_id), "w") as config_fh:
-            yaml.safe_dump(DEFAULT_CONFIG, config_fh)
-
-        with open("data/{}/sections.yml".format(server_id), "w") as sections_fh:
-            yaml.safe_dump(DEFAULT_SECTIONS, sections_fh)
-
-        with open("data/{}/notes.yml".format(server_id), "w") as notes_fh:
-            yaml.safe_dump(DEFAULT_NOTES, notes_fh)
-
-        self.data[server_id] = {
-            "config": DEFAULT_CONFIG.copy(),
-            "sections": self.load_sections(DEFAULT_SECTIONS)
-        }
+    def create_server_files(self, server_id) -> bool:
+        return self.backend.create_server(server_id, {
+            "config": DEFAULT_CONFIG,
+            "sections": DEFAULT_SECTIONS,
+            "notes": DEFAULT_NOTES
+        })
 
-        self.notes[server_id] = DEFAULT_NOTES
+    def install_default_server(self, server_id):
+        self.install_server(
+            server_id, DEFAULT_CONFIG.copy(), copy.deepcopy(DEFAULT_SECTIONS),
+            copy.deepcopy(DEFAULT_NOTES), copy.deepcopy(DEFAULT_PUBLISHED)
+        )
 
         log.info("Added server: {}".format(server_id))
 
+    async def add_server_async(self, server_id) -> bool:
+        if not await self.loop.run_in_executor(self.executor, self.create_server_files, server_id):
+            return False
+
+        self.install_default_server(server_id)
         return True
 
     # Convenience functions
@@ -215,17 +346,21 @@ class DataManager:
     def set_config(self, server, key, value):
         self.data[server.id]["config"][key] = value
 
-    def add_section(self, server, section):
-        self.data[server.id]["sections"].append([section.name, section])
+    def add_section(self, server, section) -> bool:
+        return self.data[server.id]["sections"].append(section.name, section)
+
+    def remove_section(self, server, section) -> BaseSection:
+        return self.data[server.id]["sections"].remove(section)
 
-    def remove_section(self, server, section):
-        section = section.lower()
+    def rename_section(self, server, section, new_name) -> bool:
         sections = self.data[server.id]["sections"]
+        section_object = sections.get(section)
 
-        for i, section_tuple in enumerate(sections):
-            if section_tuple[0].lower() == section:
-                sections.pop(i)
-                return
+        if not section_object or not sections.rename(section, new_name):
+            return False
+
+        section_object.name = new_name
+        return True
 
     def get_section_class(self, section_type) -> type:
         return SECTION_TYPES.get(section_type.lower())
@@ -233,53 +368,39 @@ class DataManager:
     def get_server_command_chars(self, server) -> str:
         return self.data[server.id]["config"]["control_chars"]
 
-    def get_section(self, server, section) -> BaseSection:
-        section = section.lower()
-        sections = self.data[server.id]["sections"]
-
-        for name, s in sections:
-            if name.lower() == section:
-                return s
+    def get_server_prefixes(self, server) -> List[str]:
+        # control_chars is either a single prefix, as it always has been - spaces and all - or a list of them, as
+        # set by giving the config command more than one
+        chars = self.get_server_command_chars(server)
 
-        return None
+        if isinstance(chars, list):
+            return [str(prefix) for prefix in chars]
 
-    def has_section(self, server, section) -> bool:
-        section = section.lower()
-        sections = self.data[server.id]["sections"]
+        return [str(chars)]
 
-        for name, s in sections:
-            if name.lower() == section:
-                return True
+    def get_section(self, server, section) -> BaseSection:
+        return self.data[server.id]["sections"].get(section)
 
-        return False
+    def has_section(self, server, section) -> bool:
+        return section in self.data[server.id]["sections"]
 
-    def get_sections(self, server) -> List[List[Union[BaseSection, str]]]:
+    def get_sections(self, server) -> Registry:
         return self.data[server.id]["sections"]
 
     def get_notes(self, server):
         return self.notes[server.id]["notes"]
 
-    def swap_sections(self, server, left, right):
-        left = left.lower()
-        right = right.lower()
-        sections = self.data[server.id]["sections"]
-
-        left_index = -1
-        right_index = -1
-
-        for i, section in enumerate(sections):
-            name = section[0].lower()
+    def get_published(self, server):
+        return self.published[server.id]
 
-            if name == left.lower():
-                left_index = i
-                continue
-
-            if name == right.lower():
-                right_index = i
-                continue
+    def set_published(self, server, channel, messages):
+        self.published[server.id] = {
+            "channel": channel.id,
+            "messages": messages
+        }
 
-        if left_index >= 0 and right_index >= 0:
-            sections[left_index], sections[right_index] = sections[right_index], sections[left_index]
+    def swap_sections(self, server, left, right) -> bool:
+        return self.data[server.id]["sections"].swap(left, right)
 
     def get_channel(self, server) -> str:
         return self.data[server.id]["config"]["info_channel"]
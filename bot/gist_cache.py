@@ -0,0 +1,157 @@
+# coding=utf-8
+import logging
+import time
+
+import asyncio
+
+from collections import OrderedDict
+from typing import List, Optional
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Gists")
+
+GIST_URL = "https://api.github.com/gists/{}"
+GIST_REVISION_URL = "https://api.github.com/gists/{}/{}"
+
+DEFAULT_TTL = 60  # Seconds before we check whether a gist has a newer revision
+DEFAULT_MAX_ENTRIES = 256
+
+
+class LatestRevision:
+    def __init__(self, revision, etag):
+        self.revision = revision
+        self.etag = etag
+        self.fetched = time.monotonic()
+
+
+class GistCache:
+    # The files of every gist revision we've fetched, keyed by (gist ID, revision). A given revision never changes,
+    # so those entries are only ever evicted, least recently used first. For a plain `gist:<id>` we also remember
+    # which revision was latest; once that's `ttl` seconds old we ask GitHub again with the ETag we got, and a 304
+    # (which doesn't count against the rate limit) means the cached revision is still current.
+    #
+    # Concurrent requests for the same gist share a single fetch.
+
+    def __init__(self, pool, loop, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.pool = pool
+        self.loop = loop
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.revisions = OrderedDict()  # (gist_id, revision) -> [[filename, content]]
+        self.latest = OrderedDict()  # gist_id -> LatestRevision
+        self.pending = {}  # (gist_id, revision or None) -> Future
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def __str__(self):
+        return "{} cached, {} hits, {} misses, {} revalidated".format(
+            len(self.revisions), self.hits, self.misses, self.revalidated
+        )
+
+    def lookup(self, key) -> Optional[List[List[str]]]:
+        files = self.revisions.get(key)
+
+        if files is not None:
+            self.revisions.move_to_end(key)
+
+        return files
+
+    def store(self, key, files):
+        self.revisions[key] = files
+        self.revisions.move_to_end(key)
+
+        while len(self.revisions) > self.max_entries:
+            self.revisions.popitem(last=False)
+
+    def remember_latest(self, gist_id, latest: LatestRevision):
+        self.latest[gist_id] = latest
+        self.latest.move_to_end(gist_id)
+
+        while len(self.latest) > self.max_entries:
+            self.latest.popitem(last=False)
+
+    async def get(self, gist_id, revision=None) -> Optional[List[List[str]]]:
+        # Returns a list of [filename, content] pairs, or None if there's no such gist
+
+        if revision is None:
+            latest = self.latest.get(gist_id)
+
+            if latest is not None and time.monotonic() - latest.fetched < self.ttl:
+                files = self.lookup((gist_id, latest.revision))
+
+                if files is not None:
+                    self.hits += 1
+                    return files
+        else:
+            files = self.lookup((gist_id, revision))
+
+            if files is not None:
+                self.hits += 1
+                return files
+
+        key = (gist_id, revision)
+
+        if key in self.pending:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+            future = asyncio.ensure_future(self.fetch(gist_id, revision), loop=self.loop)
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+
+            self.pending[key] = future
+
+        # Shielded so that one caller giving up doesn't cancel the fetch for everyone else waiting on it
+        return await asyncio.shield(self.pending[key])
+
+    async def fetch(self, gist_id, revision=None) -> Optional[List[List[str]]]:
+        headers = {}
+        cached = None
+
+        if revision is None:
+            url = GIST_URL.format(gist_id)
+            latest = self.latest.get(gist_id)
+
+            if latest is not None and latest.etag:
+                cached = self.lookup((gist_id, latest.revision))
+
+                if cached is not None:
+                    headers["If-None-Match"] = latest.etag
+        else:
+            url = GIST_REVISION_URL.format(gist_id, revision)
+
+        log.debug("Grabbing gist info: {}".format(url))
+
+        async with self.pool.get(url, headers=headers) as response:
+            if response.status == 304 and cached is not None:
+                self.revalidated += 1
+
+                latest.fetched = time.monotonic()
+                self.store((gist_id, latest.revision), cached)
+
+                return cached
+
+            gist_json = await response.json()
+            etag = response.headers.get("ETag")
+
+        if "files" not in gist_json:
+            return None
+
+        files = [[filename, file["content"]] for filename, file in gist_json["files"].items()]
+
+        if gist_json.get("history"):
+            fetched_revision = gist_json["history"][0]["version"]
+        else:
+            fetched_revision = revision
+
+        if fetched_revision is not None:
+            self.store((gist_id, fetched_revision), files)
+
+            if revision is None:
+                self.remember_latest(gist_id, LatestRevision(fetched_revision, etag))
+
+        return files
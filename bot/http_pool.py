@@ -0,0 +1,83 @@
+# coding=utf-8
+import logging
+
+import asyncio
+
+from aiohttp import ClientSession, TCPConnector
+from urllib.parse import urlsplit
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("HTTP")
+
+DEFAULT_LIMIT = 20
+DEFAULT_LIMIT_PER_HOST = 4
+DEFAULT_KEEPALIVE_TIMEOUT = 30  # Seconds
+
+
+class HTTPPool:
+    # A single HTTP session for everything the bot fetches (gists, URL sections), so connections, DNS lookups and
+    # TLS sessions are reused instead of being set up from scratch for every request. The connector caps the total
+    # number of connections, and we cap connections per host ourselves so one slow site can't hog the pool.
+
+    def __init__(self, loop, limit=DEFAULT_LIMIT, limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT):
+        self.loop = loop
+        self.limit_per_host = limit_per_host
+
+        self.host_semaphores = {}
+
+        connector = TCPConnector(
+            limit=limit, use_dns_cache=True, keepalive_timeout=keepalive_timeout, loop=loop
+        )
+
+        self.session = ClientSession(connector=connector, loop=loop)
+
+    def get_semaphore(self, url) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.limit_per_host)
+
+        return self.host_semaphores[host]
+
+    def request(self, method, url, **kwargs) -> "PooledRequest":
+        return PooledRequest(self, method, url, kwargs)
+
+    def get(self, url, **kwargs) -> "PooledRequest":
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        if not self.session.closed:
+            self.session.close()
+
+
+class PooledRequest:
+    # Use as `async with pool.get(url) as response:` - just like a session request, but holding the host's
+    # semaphore for as long as the response is open
+
+    def __init__(self, pool, method, url, kwargs):
+        self.pool = pool
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+        self.semaphore = None
+        self.context = None
+
+    async def __aenter__(self):
+        self.semaphore = self.pool.get_semaphore(self.url)
+        await self.semaphore.acquire()
+
+        try:
+            self.context = self.pool.session.request(self.method, self.url, **self.kwargs)
+            return await self.context.__aenter__()
+        except Exception:
+            self.semaphore.release()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self.context.__aexit__(exc_type, exc, tb)
+        finally:
+            self.semaphore.release()
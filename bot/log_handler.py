@@ -1,19 +1,64 @@
 # coding=utf-8
-from logging import Handler, INFO, LogRecord, DEBUG
+from collections import OrderedDict
+from logging import Handler, INFO, LogRecord, DEBUG, WARNING
 
+import datetime
 import sys
+import traceback
 
-from bot.client import Client
+import asyncio
+
+from discord import Embed
+
+from bot.client import Client, LOG_COLOURS
 
 __author__ = "Gareth Coles"
 
+FLUSH_INTERVAL = 5  # Seconds to collect records for before sending them as one embed
+MAX_PENDING = 50  # Distinct entries per flush; anything past this is only counted
+MAX_DESCRIPTION = 2000  # Embed descriptions are limited to 2048 characters
+MAX_TRACEBACK = 1000
+
+
+def truncate(line, limit) -> str:
+    # Cuts the line down to `limit` characters, closing the traceback's code block if we cut into it. Trailing
+    # backticks are dropped first, so we never leave half a fence behind.
+
+    line = line[:limit - 6].rstrip("`") + "..."
+
+    if line.count("```") % 2:
+        line += "```"
+
+    return line
+
+
+class LogEntry:
+    def __init__(self, record: LogRecord, text):
+        self.record = record
+        self.text = text
+        self.count = 1
+        self.last_created = record.created
+
 
 class DiscordLogHandler(Handler):
-    def __init__(self, client: Client, level=INFO):
+    # Relays log records to the log channel without ever blocking whoever is logging. Records are collected for
+    # `flush_interval` seconds and sent as a single embed, with repeats of the same message counted rather than
+    # listed, and once `max_pending` distinct entries are waiting any more are dropped (and counted) - so a burst
+    # of warnings costs one message instead of competing with real traffic for the rate limit.
+
+    def __init__(self, client: Client, level=INFO, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
         super().__init__(level=level)
         self.client = client
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.pending = OrderedDict()  # (logger name, level, message) -> LogEntry
+        self.dropped = 0
+        self.flush_scheduled = False
 
     def emit(self, record: LogRecord):
+        # Called with the handler's lock held, from whichever thread is logging
+
         if record.levelno <= DEBUG:
             return
 
@@ -24,6 +69,104 @@ class DiscordLogHandler(Handler):
             return
 
         try:
-            self.client.log_to_channel(record)
+            text = record.getMessage()
+        except Exception:
+            return self.handleError(record)
+
+        key = (record.name, record.levelno, text)
+        entry = self.pending.get(key)
+
+        if entry is not None:
+            entry.count += 1
+            entry.last_created = record.created
+        elif len(self.pending) >= self.max_pending:
+            self.dropped += 1
+        else:
+            self.pending[key] = LogEntry(record, text)
+
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+
+            try:
+                self.client.loop.call_soon_threadsafe(self.schedule_flush)
+            except RuntimeError:  # The loop has been closed
+                pass
+
+    def schedule_flush(self):
+        self.client.loop.call_later(
+            self.flush_interval, lambda: asyncio.ensure_future(self.send_pending(), loop=self.client.loop)
+        )
+
+    def take_pending(self):
+        self.acquire()
+
+        try:
+            entries, dropped = list(self.pending.values()), self.dropped
+
+            self.pending = OrderedDict()
+            self.dropped = 0
+            self.flush_scheduled = False
+        finally:
+            self.release()
+
+        return entries, dropped
+
+    async def send_pending(self):
+        entries, dropped = self.take_pending()
+
+        if not entries:
+            return
+
+        try:
+            await self.client.log_to_channel(self.create_embed(entries, dropped))
         except Exception as e:
-            print("Failed to send log entry to Discord: {}".format(e), file=sys.stderr)
+            print("Failed to send log entries to Discord: {}".format(e), file=sys.stderr)
+
+    def create_embed(self, entries, dropped) -> Embed:
+        level = max(entry.record.levelno for entry in entries)
+        total = sum(entry.count for entry in entries) + dropped
+
+        lines = []
+        length = 0
+        omitted = dropped
+
+        for entry in entries:
+            record = entry.record
+
+            if len(entries) == 1:
+                line = entry.text
+            else:
+                line = "**{}** `{}`: {}".format(record.levelname, record.name, entry.text)
+
+            if entry.count > 1:
+                line += " (x{})".format(entry.count)
+
+            if record.exc_info:
+                trace = "".join(traceback.format_exception(*record.exc_info))
+                line += "\n```{}```".format(trace[-MAX_TRACEBACK:])
+
+            if length + len(line) + 1 > MAX_DESCRIPTION:
+                if not lines:
+                    line = truncate(line, MAX_DESCRIPTION)
+                else:
+                    omitted += entry.count
+                    continue
+
+            lines.append(line)
+            length += len(line) + 1
+
+        if omitted:
+            lines.append("*...and {} more*".format(omitted))
+
+        if len(entries) == 1 and not dropped:
+            title = "{} / {}".format(entries[0].record.name, entries[0].record.levelname)
+        else:
+            title = "{} log entries".format(total)
+
+        embed = Embed(title=title, description="\n".join(lines))
+        embed.colour = LOG_COLOURS.get(level, LOG_COLOURS[WARNING])
+
+        dt = datetime.datetime.fromtimestamp(max(entry.last_created for entry in entries))
+        embed.set_footer(text=dt.strftime("%B %d %Y, %H:%M:%S"))
+
+        return embed
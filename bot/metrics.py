@@ -0,0 +1,227 @@
+# coding=utf-8
+import logging
+import time
+
+from aiohttp import web
+from typing import Dict, List, Tuple
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Metrics")
+
+PROMETHEUS_PREFIX = "infobot_"
+
+
+class Timer:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "Timer"):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Timing:
+    # `with metrics.time("name", label=value):` - works just as well around code that awaits
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class Metrics:
+    # Counters and timers, each series identified by a name and a set of labels (command, server, section type
+    # and so on). Everything lives in memory and is reset on restart; it's shown by the `stats` command and, if
+    # enabled, served in Prometheus' text format.
+
+    def __init__(self):
+        self.started = time.time()
+
+        self.counters = {}  # name -> {labels: value}
+        self.timers = {}  # name -> {labels: Timer}
+
+    @staticmethod
+    def labels_key(labels) -> Tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = self.labels_key(labels)
+
+        series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        series = self.timers.setdefault(name, {})
+        key = self.labels_key(labels)
+
+        if key not in series:
+            series[key] = Timer()
+
+        series[key].observe(seconds)
+
+    def time(self, name, **labels) -> Timing:
+        return Timing(self, name, labels)
+
+    def count(self, name, by=(), **match) -> Dict[Tuple, int]:
+        # Totals for a counter, grouped by the labels in `by` and only including series whose labels match `match`
+
+        totals = {}
+
+        for key, value in self.counters.get(name, {}).items():
+            labels = dict(key)
+
+            if any(labels.get(label) != str(wanted) for label, wanted in match.items()):
+                continue
+
+            group = tuple(labels.get(label) for label in by)
+            totals[group] = totals.get(group, 0) + value
+
+        return totals
+
+    def timing(self, name, by=(), **match) -> Dict[Tuple, Timer]:
+        totals = {}
+
+        for key, timer in self.timers.get(name, {}).items():
+            labels = dict(key)
+
+            if any(labels.get(label) != str(wanted) for label, wanted in match.items()):
+                continue
+
+            group = tuple(labels.get(label) for label in by)
+
+            if group not in totals:
+                totals[group] = Timer()
+
+            totals[group].merge(timer)
+
+        return totals
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def format_labels(labels):
+            if not labels:
+                return ""
+
+            return "{{{}}}".format(",".join(
+                '{}="{}"'.format(label, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+                for label, value in labels
+            ))
+
+        for name, series in sorted(self.counters.items()):
+            name = PROMETHEUS_PREFIX + name
+            lines.append("# TYPE {} counter".format(name))
+
+            for key, value in series.items():
+                lines.append("{}{} {}".format(name, format_labels(key), value))
+
+        for name, series in sorted(self.timers.items()):
+            name = PROMETHEUS_PREFIX + name
+            lines.append("# TYPE {} summary".format(name))
+
+            for key, timer in series.items():
+                lines.append("{}_count{} {}".format(name, format_labels(key), timer.count))
+                lines.append("{}_sum{} {}".format(name, format_labels(key), timer.total))
+
+            lines.append("# TYPE {}_max gauge".format(name))
+
+            for key, timer in series.items():
+                lines.append("{}_max{} {}".format(name, format_labels(key), timer.max))
+
+        lines.append("# TYPE {}uptime_seconds gauge".format(PROMETHEUS_PREFIX))
+        lines.append("{}uptime_seconds {}".format(PROMETHEUS_PREFIX, time.time() - self.started))
+
+        return "\n".join(lines) + "\n"
+
+
+def format_counts(counts) -> List[str]:
+    return [
+        "  {:<24} {:>8}".format(" / ".join(str(label) for label in group) or "total", count)
+        for group, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+def format_timers(timers) -> List[str]:
+    return [
+        "  {:<24} {:>8}  avg {:>9.1f}ms  max {:>9.1f}ms".format(
+            " / ".join(str(label) for label in group) or "total", timer.count, timer.average * 1000, timer.max * 1000
+        )
+        for group, timer in sorted(timers.items(), key=lambda item: item[1].count, reverse=True)
+    ]
+
+
+def server_id(target) -> str:
+    # The ID of the server a channel, message or member belongs to, for labelling API calls
+
+    server = getattr(target, "server", None)
+
+    if server is None and hasattr(target, "channel"):
+        server = getattr(target.channel, "server", None)
+
+    return getattr(server, "id", None) or "none"
+
+
+metrics = Metrics()
+
+
+class MetricsServer:
+    # Serves /metrics for Prometheus to scrape. Only started if `metrics_port` is set in the config.
+
+    def __init__(self, loop, host="127.0.0.1", port=9090):
+        self.loop = loop
+        self.host = host
+        self.port = port
+
+        self.app = None
+        self.handler = None
+        self.server = None
+
+    async def handle_metrics(self, request):
+        return web.Response(
+            text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self):
+        self.app = web.Application(loop=self.loop)
+        self.app.router.add_route("GET", "/metrics", self.handle_metrics)
+
+        self.handler = self.app.make_handler()
+        self.server = await self.loop.create_server(self.handler, self.host, self.port)
+
+        log.info("Serving metrics on http://{}:{}/metrics".format(self.host, self.port))
+
+    async def stop(self):
+        if self.server is None:
+            return
+
+        self.server.close()
+        await self.server.wait_closed()
+
+        await self.app.shutdown()
+        await self.handler.finish_connections(1.0)
+        await self.app.cleanup()
+
+        self.server = None
@@ -0,0 +1,29 @@
+# coding=utf-8
+import re
+
+from typing import List, Optional
+
+__author__ = "Gareth Coles"
+
+
+class PrefixMatcher:
+    # A single compiled regex matching any of a server's command prefixes, or a mention of the bot in either its
+    # plain (<@id>) or nickname (<@!id>) form. Longer prefixes are tried first, so `!!` wins over `!`.
+
+    def __init__(self, prefixes: List[str], user_id):
+        self.prefixes = prefixes
+
+        alternatives = [r"<@!?{}>".format(re.escape(str(user_id)))]
+        alternatives += [re.escape(prefix) for prefix in sorted(prefixes, key=len, reverse=True)]
+
+        self.regex = re.compile(r"(?:{})\s*".format("|".join(alternatives)))
+
+    def match(self, content) -> Optional[str]:
+        # Returns the rest of the message if it starts with a prefix, otherwise None
+
+        match = self.regex.match(content)
+
+        if match is None:
+            return None
+
+        return content[match.end():].rstrip()
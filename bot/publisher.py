@@ -0,0 +1,255 @@
+# coding=utf-8
+import logging
+
+import asyncio
+import discord
+
+from typing import List
+
+from bot.metrics import metrics
+from bot.utils import digest
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Publisher")
+
+MAX_CONCURRENT_RENDERS = 5
+
+END = object()  # Marks the end of a section's stream
+
+
+async def iter_list(items):
+    for item in items:
+        yield item
+
+
+class MessageStream:
+    # What stream_messages returns: an async iterator over the messages, plus close(), which cancels any section
+    # that's still streaming. The sections start as soon as this is created, so it must be closed even if it's
+    # never iterated over.
+
+    def __init__(self, messages, tasks):
+        self.messages = messages
+        self.tasks = tasks
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.messages.__anext__()
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+
+class MessageReference:
+    # Stand-in for a message we posted earlier and only know the ID of. `edit_message` and `delete_message` only
+    # need the ID and channel, so this saves fetching every message from the API before touching it.
+
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.server = channel.server
+        self.id = message_id
+
+
+class PublishResult:
+    def __init__(self):
+        self.full = False
+        self.cleared = None
+        self.kept = 0
+        self.edited = 0
+        self.sent = 0
+        self.deleted = 0
+
+    def __str__(self):
+        if self.full:
+            return "{}, `{}` messages posted".format(self.cleared, self.sent)
+
+        return "`{}` edited, `{}` added, `{}` removed, `{}` unchanged".format(
+            self.edited, self.sent, self.deleted, self.kept
+        )
+
+
+class Publisher:
+    # Publishes a server's sections to its info channel, remembering which message holds which rendered chunk so
+    # that later updates only touch the messages that actually changed.
+
+    def __init__(self, client):
+        self.client = client
+        self.locks = {}  # Server ID -> asyncio.Lock, so that only one update runs on a server at a time
+
+    async def render_sections(self, sections) -> List[List[str]]:
+        # Renders every section at once, so a server with several URL sections waits for the slowest fetch rather
+        # than all of them in turn. Results come back in the same order as the sections.
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_RENDERS)
+
+        async def render(section):
+            async with semaphore:
+                with metrics.time("section_render_seconds", type=section._type):
+                    return await section.get_rendered(self.client)
+
+        return await asyncio.gather(*[render(section) for section in sections])
+
+    def stream_messages(self, server) -> MessageStream:
+        # Returns an async iterator over the server's messages, yielding each one as soon as it (and everything
+        # before it) is ready. Every section starts streaming into its own queue right away, so a full publish can
+        # fetch while it clears the channel, and start sending while later sections - or the rest of a large page
+        # that wasn't cached - are still being fetched.
+
+        sections = list(self.client.data_manager.get_sections(server))
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_RENDERS)
+        queues = [asyncio.Queue() for _ in sections]
+
+        async def pump(section, queue):
+            try:
+                async with semaphore:
+                    with metrics.time("section_render_seconds", type=section._type):
+                        async for message in section.stream(self.client):
+                            queue.put_nowait(message)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(END)
+
+        tasks = [asyncio.ensure_future(pump(section, queue)) for (_, section), queue in zip(sections, queues)]
+
+        return MessageStream(self.drain_queues(sections, queues, tasks), tasks)
+
+    async def drain_queues(self, sections, queues, tasks):
+        try:
+            for (name, section), queue in zip(sections, queues):
+                yield "**__{}__**".format(name)
+
+                if section.get_header():
+                    yield section.get_header()
+
+                while True:
+                    message = await queue.get()
+
+                    if message is END:
+                        break
+
+                    if isinstance(message, Exception):
+                        raise message
+
+                    yield message
+
+                if section.get_footer():
+                    yield section.get_footer()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def render_messages(self, server) -> List[str]:
+        contents = self.stream_messages(server)
+
+        try:
+            return [message async for message in contents]
+        finally:
+            contents.close()
+
+    async def publish(self, server, channel, full=False) -> PublishResult:
+        # Two updates running at once would both post to the channel, and only one of them could be recorded - so
+        # a second update waits for the first, and then only has to catch up on what changed since
+
+        if server.id not in self.locks:
+            self.locks[server.id] = asyncio.Lock()
+
+        async with self.locks[server.id]:
+            return await self.publish_server(server, channel, full)
+
+    async def publish_server(self, server, channel, full=False) -> PublishResult:
+        data_manager = self.client.data_manager
+        published = data_manager.get_published(server)
+
+        if published["channel"] != channel.id or not published["messages"]:
+            full = True
+
+        if full:
+            contents = self.stream_messages(server)
+        else:
+            contents = await self.render_messages(server)
+
+            try:
+                with metrics.time("publish_seconds", mode="incremental"):
+                    result = await self.publish_incremental(channel, contents, published["messages"])
+            except discord.NotFound:
+                log.warning(
+                    "A published message is missing from channel {} on server {}; falling back to a full "
+                    "update".format(channel.id, server.id)
+                )
+            else:
+                data_manager.mark_dirty(server.id)
+                return result
+
+        try:
+            with metrics.time("publish_seconds", mode="full"):
+                result = await self.publish_full(channel, contents)
+        finally:
+            if isinstance(contents, MessageStream):
+                # If clearing the channel failed, we never started iterating - so nothing else will stop the
+                # sections that are still streaming
+                contents.close()
+
+            # Whatever made it into the channel has been recorded, even if we didn't get to the end
+            data_manager.mark_dirty(server.id)
+
+        return result
+
+    async def publish_full(self, channel, contents) -> PublishResult:
+        # `contents` may be a list of messages, or an async iterator from stream_messages
+
+        result = PublishResult()
+        result.full = True
+
+        result.cleared = await self.client.clear_channel(channel)
+
+        messages = []
+        self.client.data_manager.set_published(channel.server, channel, messages)
+
+        if isinstance(contents, list):
+            contents = iter_list(contents)
+
+        async for content in contents:
+            sent_message = await self.client.scheduler.send_message(channel, content)
+            messages.append([sent_message.id, digest(content)])
+            result.sent += 1
+
+        return result
+
+    async def publish_incremental(self, channel, contents, messages) -> PublishResult:
+        # Messages can't be reordered, so we diff by position: a changed chunk is edited in place, new chunks are
+        # appended after the last message we own, and any leftovers from a longer previous render are deleted.
+
+        result = PublishResult()
+
+        for i, content in enumerate(contents):
+            content_digest = digest(content)
+
+            if i < len(messages):
+                message_id, old_digest = messages[i]
+
+                if old_digest == content_digest:
+                    result.kept += 1
+                    continue
+
+                await self.client.scheduler.edit_message(MessageReference(channel, message_id), content)
+                messages[i] = [message_id, content_digest]
+                result.edited += 1
+            else:
+                sent_message = await self.client.scheduler.send_message(channel, content)
+                messages.append([sent_message.id, content_digest])
+                result.sent += 1
+
+        while len(messages) > len(contents):
+            message_id, _ = messages.pop()
+
+            try:
+                await self.client.scheduler.delete_message(MessageReference(channel, message_id))
+            except discord.NotFound:
+                pass
+
+            result.deleted += 1
+        return result
@@ -0,0 +1,138 @@
+# coding=utf-8
+import logging
+
+from typing import Any, Iterator, List, Optional
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Registry")
+
+
+class Registry:
+    # An ordered list of [name, value] pairs, with a case-insensitive index from name to position. Lookups are a
+    # single dict access; only removal has to shift (and re-index) the entries after the one removed.
+
+    def __init__(self, items=None):
+        self.items = []  # [[name, value]]
+        self.index = {}  # casefolded name -> position
+
+        for name, value in items or []:
+            if name in self:
+                # Stored data from before names were casefolded may have names that now collide ("Straße" and
+                # "STRASSE"); keep both rather than losing one
+                new_name = self.unique_name(name)
+                log.warning("Name {!r} collides with {!r}; keeping it as {!r}".format(
+                    name, self.get_name(name), new_name
+                ))
+                name = new_name
+
+            self.append(name, value)
+
+    @staticmethod
+    def key(name: str) -> str:
+        return name.casefold()
+
+    def __iter__(self) -> Iterator[List]:
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, name):
+        return self.key(name) in self.index
+
+    def __getitem__(self, position) -> List:
+        return self.items[position]
+
+    def position(self, name) -> Optional[int]:
+        return self.index.get(self.key(name))
+
+    def get(self, name, default=None) -> Any:
+        position = self.index.get(self.key(name))
+
+        if position is None:
+            return default
+
+        return self.items[position][1]
+
+    def get_name(self, name) -> Optional[str]:
+        # The name as it was originally stored, with its original casing
+
+        position = self.index.get(self.key(name))
+
+        if position is None:
+            return None
+
+        return self.items[position][0]
+
+    def unique_name(self, name) -> str:
+        # `name`, or `name (2)`, `name (3)` and so on - whichever is free first
+
+        number = 1
+        new_name = name
+
+        while new_name in self:
+            number += 1
+            new_name = "{} ({})".format(name, number)
+
+        return new_name
+
+    def append(self, name, value) -> bool:
+        key = self.key(name)
+
+        if key in self.index:
+            return False
+
+        self.index[key] = len(self.items)
+        self.items.append([name, value])
+
+        return True
+
+    def set(self, name, value):
+        # Replaces the value for an existing name (keeping its position and casing), or appends a new one
+
+        position = self.index.get(self.key(name))
+
+        if position is None:
+            self.append(name, value)
+        else:
+            self.items[position][1] = value
+
+    def remove(self, name) -> Any:
+        position = self.index.pop(self.key(name), None)
+
+        if position is None:
+            return None
+
+        _, value = self.items.pop(position)
+
+        for i in range(position, len(self.items)):
+            self.index[self.key(self.items[i][0])] = i
+
+        return value
+
+    def swap(self, left, right) -> bool:
+        left_key, right_key = self.key(left), self.key(right)
+
+        if left_key not in self.index or right_key not in self.index:
+            return False
+
+        left_index, right_index = self.index[left_key], self.index[right_key]
+
+        self.items[left_index], self.items[right_index] = self.items[right_index], self.items[left_index]
+        self.index[left_key], self.index[right_key] = right_index, left_index
+
+        return True
+
+    def rename(self, name, new_name) -> bool:
+        key, new_key = self.key(name), self.key(new_name)
+
+        if key not in self.index or (new_key in self.index and new_key != key):
+            return False
+
+        position = self.index.pop(key)
+
+        self.items[position][0] = new_name
+        self.index[new_key] = position
+
+        return True
@@ -0,0 +1,126 @@
+# coding=utf-8
+import logging
+
+import asyncio
+import discord
+
+from bot.metrics import metrics
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Scheduler")
+
+# Discord's documented limits, per channel: (requests, seconds). Sends and edits share a window here, which is
+# stricter than Discord, but keeps a full update from crowding out its own edits.
+ROUTE_LIMITS = {
+    "message": (5, 5.0),
+    "delete": (5, 1.0),
+    "bulk_delete": (1, 1.0)
+}
+
+# ...and 50 requests per second overall
+GLOBAL_CAPACITY = 50
+GLOBAL_PERIOD = 1.0
+
+
+class RateWindow:
+    # Discord's rate limits are fixed windows: `capacity` requests, with the window starting at the first request
+    # and resetting `period` seconds later. We track them the same way - a bucket that refilled steadily would let
+    # us send again before the window had reset, and earn a 429.
+
+    def __init__(self, capacity, period, loop):
+        self.capacity = capacity
+        self.period = period
+        self.loop = loop
+
+        self.remaining = capacity
+        self.reset_at = 0
+
+    def delay(self) -> float:
+        # How long until the window has room; zero if we can go right now
+
+        now = self.loop.time()
+
+        if now >= self.reset_at or self.remaining >= 1:
+            return 0
+
+        return self.reset_at - now
+
+    def take(self):
+        now = self.loop.time()
+
+        if now >= self.reset_at:
+            self.remaining = self.capacity
+            self.reset_at = now + self.period
+
+        self.remaining -= 1
+
+
+class SendScheduler:
+    # Every message we publish or delete goes through here. Each channel gets a window and a FIFO queue per route,
+    # and channels then take turns at the global window, so one guild's full update can't starve another guild's.
+    #
+    # discord.py waits out and retries any 429 it gets before raising, and doesn't give us the rate limit headers
+    # of successful responses, so these windows are all we have to go on. A 429 that does reach us is counted.
+
+    def __init__(self, client):
+        self.client = client
+        self.loop = client.loop
+
+        self.windows = {}  # (route, channel ID) -> RateWindow
+        self.locks = {}  # (route, channel ID) -> asyncio.Lock
+
+        self.global_window = RateWindow(GLOBAL_CAPACITY, GLOBAL_PERIOD, self.loop)
+        self.global_lock = asyncio.Lock()
+
+    def get_window(self, route, channel) -> RateWindow:
+        key = (route, channel.id)
+
+        if key not in self.windows:
+            self.windows[key] = RateWindow(*ROUTE_LIMITS[route], self.loop)
+            self.locks[key] = asyncio.Lock()
+
+        return self.windows[key]
+
+    async def acquire(self, route, channel):
+        window = self.get_window(route, channel)
+
+        async with self.locks[(route, channel.id)]:
+            await self.wait_for(window)
+
+            async with self.global_lock:
+                await self.wait_for(self.global_window)
+
+    async def wait_for(self, window):
+        delay = window.delay()
+
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = window.delay()
+
+        window.take()
+
+    async def run(self, route, channel, func, *args, **kwargs):
+        await self.acquire(route, channel)
+
+        try:
+            return await func(*args, **kwargs)
+        except discord.HTTPException as e:
+            if getattr(e, "response", None) is not None and e.response.status == 429:
+                metrics.increment("rate_limited_total", server=channel.server.id)
+                log.warning("Rate-limited in channel {} despite retrying: {}".format(channel.id, e))
+
+            raise
+
+    async def send_message(self, channel, content=None, *, embed=None):
+        return await self.run("message", channel, self.client.send_message, channel, content, embed=embed)
+
+    async def edit_message(self, message, content=None, *, embed=None):
+        return await self.run("message", message.channel, self.client.edit_message, message, content, embed=embed)
+
+    async def delete_message(self, message):
+        return await self.run("delete", message.channel, self.client.delete_message, message)
+
+    async def delete_messages(self, messages):
+        messages = list(messages)
+        return await self.run("bulk_delete", messages[0].channel, self.client.delete_messages, messages)
@@ -6,15 +6,40 @@ __author__ = "Gareth Coles"
 
 class BaseSection:
     _type = None
+    cacheable = True  # Whether render() only depends on the section's own data
 
     def __init__(self, name, header="", footer=""):
         self.name = name
         self.header = header
         self.footer = footer
 
-    async def render(self) -> List[str]:
+        self.rendered = None
+
+    async def render(self, client) -> List[str]:
         pass
 
+    async def get_rendered(self, client) -> List[str]:
+        # The output of render(), kept until the section is next changed - so publishing an unchanged section
+        # doesn't have to format every entry again
+
+        if not self.cacheable:
+            return await self.render(client)
+
+        if self.rendered is None:
+            self.rendered = await self.render(client)
+
+        return self.rendered
+
+    async def stream(self, client):
+        # Yields rendered messages as they become available. Only sections that have to fetch their content need
+        # to override this; everything else just hands over its (cached) render.
+
+        for message in await self.get_rendered(client):
+            yield message
+
+    def invalidate(self):
+        self.rendered = None
+
     async def show(self) -> List[str]:
         pass
 
@@ -23,9 +48,11 @@ class BaseSection:
 
     def set_header(self, header):
         self.header = header
+        self.invalidate()
 
     def set_footer(self, footer):
         self.footer = footer
+        self.invalidate()
 
     def get_header(self) -> str:
         return self.header
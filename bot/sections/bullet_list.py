@@ -32,6 +32,7 @@ class BulletedListSection(BaseSection):
                     self.items.append(item)
                     added += 1
 
+            self.invalidate()
             client.sections_updated(message.server)
 
             if len(data) > 1:
@@ -57,6 +58,7 @@ class BulletedListSection(BaseSection):
                 return "Unknown item: `{}`\n\nNote that indexes start at `1`".format(data[0])
 
             self.items.pop(index)
+            self.invalidate()
             client.sections_updated(message.server)
             return "Item at index `{}` removed".format(data[0])
         elif command == "set":
@@ -76,6 +78,7 @@ class BulletedListSection(BaseSection):
 
             self.items[left] = right
 
+            self.invalidate()
             client.sections_updated(message.server)
             return "Item at index `{}` set to `{}`".format(left, right)
         elif command == "swap":
@@ -95,6 +98,7 @@ class BulletedListSection(BaseSection):
 
             self.items[left], self.items[right] = self.items[right], self.items[left]
 
+            self.invalidate()
             client.sections_updated(message.server)
             return "Items at indexes `{}` and `{}` swapped".format(data[0], data[1])
         elif command == "template":
@@ -110,12 +114,13 @@ class BulletedListSection(BaseSection):
 
             self.template = template
 
+            self.invalidate()
             client.sections_updated(message.server)
             return "Item template has been updated."
 
         return "Unknown command: `{}`\n\nAvailable commands: `add`, `remove`, `set`, `swap`, `template`".format(command)
 
-    async def render(self) -> List[str]:
+    async def render(self, client) -> List[str]:
         return line_splitter([self.template.format(line) for line in self.items], 2000)
 
     async def show(self) -> List[str]:
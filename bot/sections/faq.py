@@ -1,6 +1,7 @@
 # coding=utf-8
 from typing import List
 
+from bot.registry import Registry
 from bot.sections.base import BaseSection
 
 __author__ = "Gareth Coles"
@@ -19,7 +20,7 @@ class FAQSection(BaseSection):
     def __init__(self, name, questions=None, header="", footer=""):
         super().__init__(name, header=header, footer=footer)
 
-        self.questions = questions or []
+        self.questions = Registry(questions)
 
     async def process_command(self, command, data, data_string, client, message) -> str:
         if command == "add":
@@ -35,6 +36,7 @@ class FAQSection(BaseSection):
                 return "Question and answer must be shorter than {} characters.".format(1999 - len(MESSAGE_FORMAT))
 
             self.set_question(question, answer)
+            self.invalidate()
             client.sections_updated(message.server)
 
             return "Question added: `{}`".format(question)
@@ -47,6 +49,7 @@ class FAQSection(BaseSection):
             if not self.has_question(question):
                 return "No such question: `{}`".format(question)
             self.delete_question(question)
+            self.invalidate()
             client.sections_updated(message.server)
 
             return "Question deleted: `{}`".format(question)
@@ -62,6 +65,7 @@ class FAQSection(BaseSection):
                 return "Question and answer must be shorter than {} characters.".format(1999 - len(MESSAGE_FORMAT))
 
             self.set_question(question, answer)
+            self.invalidate()
             client.sections_updated(message.server)
 
             if has_question:
@@ -81,6 +85,7 @@ class FAQSection(BaseSection):
 
             self.swap_questions(left, right)
 
+            self.invalidate()
             client.sections_updated(message.server)
             return "Question positions swapped successfully"
         elif command == "rename":
@@ -92,57 +97,30 @@ class FAQSection(BaseSection):
             if not self.has_question(left):
                 return "Unknown question: `{}`".format(left)
 
-            self.rename_question(left, right)
+            if not self.rename_question(left, right):
+                return "Question already exists: `{}`".format(right)
 
+            self.invalidate()
             client.sections_updated(message.server)
             return "Question has been changed to `{}`".format(right)
         return "Unknown command: {}\n\nAvailable commands: `add`, `remove`, `rename`, `set`, `swap`".format(command)
 
-    def rename_question(self, question, new_question):
-        for i, q in enumerate(self.questions):
-            if q[0].lower() == question.lower():
-                self.questions[i] = (new_question, q[1])
+    def rename_question(self, question, new_question) -> bool:
+        return self.questions.rename(question, new_question)
 
     def has_question(self, question):
-        for q, _ in self.questions:
-            if question.lower() == q.lower():
-                return True
-
-        return False
+        return question in self.questions
 
     def set_question(self, question, answer):
-        for i, q in enumerate(self.questions):
-            if q[0].lower() == question.lower():
-                self.questions[i] = (q[0], answer)
-                return
-
-        self.questions.append((question, answer))
+        self.questions.set(question, answer)
 
     def delete_question(self, question):
-        for i, q in enumerate(self.questions):
-            if q[0].lower() == question.lower():
-                self.questions.pop(i)
-                return
+        self.questions.remove(question)
 
     def swap_questions(self, left, right):
-        left_index = -1
-        right_index = -1
-
-        for i, q in enumerate(self.questions):
-            question = q[0].lower()
-            if question == left.lower():
-                left_index = i
-                continue
-
-            if question == right.lower():
-                right_index = i
-                continue
-
-        if left_index >= 0 and right_index >= 0:
-            self.questions[left_index], self.questions[right_index] = self.questions[right_index], \
-                                                                      self.questions[left_index]
+        self.questions.swap(left, right)
 
-    async def render(self) -> List[str]:
+    async def render(self, client) -> List[str]:
         return [MESSAGE_FORMAT.format(question, answer) for question, answer in self.questions]
 
     async def show(self) -> List[str]:
@@ -155,7 +133,7 @@ class FAQSection(BaseSection):
 
     def to_dict(self) -> dict:
         return {
-            "questions": self.questions,
+            "questions": [[question, answer] for question, answer in self.questions],
             "header": self.header,
             "footer": self.footer
         }
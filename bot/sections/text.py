@@ -21,6 +21,7 @@ class TextSection(BaseSection):
 
             if data[0] and len(data[0]) < 2000:
                 self.text.append(data[0])
+                self.invalidate()
                 client.sections_updated(message.server)
                 return "Markdown block added"
             return "Block data must be shorter than 2000 characters"
@@ -37,6 +38,7 @@ class TextSection(BaseSection):
                 return "Unknown index: `{}`\n\nNote that indexes start at `1`".format(data[0])
 
             self.text.pop(index)
+            self.invalidate()
             client.sections_updated(message.server)
             return "Block at index `{}` removed".format(data[0])
         elif command == "swap":
@@ -56,12 +58,13 @@ class TextSection(BaseSection):
 
             self.text[left], self.text[right] = self.text[right], self.text[left]
 
+            self.invalidate()
             client.sections_updated(message.server)
             return "Blocks at indexes `{}` and `{}` swapped".format(data[0], data[1])
 
         return "Unknown command: `{}`\n\nAvailable commands: `add`, `remove`, `swap`".format(command)
 
-    async def render(self) -> List[str]:
+    async def render(self, client) -> List[str]:
         return self.text
 
     async def show(self) -> List[str]:
@@ -1,17 +1,63 @@
 # coding=utf-8
 from typing import List
 
-import aiohttp
-
 from bot.sections.base import BaseSection
-from bot.utils import line_splitter
+from bot.utils import split_text
 
 __author__ = "Gareth Coles"
 
+MESSAGE_SIZE = 2000
+PARAGRAPH_END = "\n\u200b"  # Keeps the gap between paragraphs that end up in separate messages
+
+
+class ParagraphSplitter:
+    # Turns a page into messages as it's downloaded - every paragraph starts a new message, and paragraphs too long
+    # for a single message are split on line and then word boundaries. A paragraph is only complete once we've seen
+    # the blank line after it, so we hold on to the last one until then; if it gets very long, we send everything
+    # up to its last line break rather than buffering the lot.
+
+    def __init__(self, max_size=MESSAGE_SIZE):
+        self.max_size = max_size - 2
+        self.pending = ""
+
+    def feed(self, text) -> List[str]:
+        messages = []
+
+        self.pending += text
+        paragraphs = self.pending.split("\n\n")
+        self.pending = paragraphs.pop()
+
+        for paragraph in paragraphs:
+            messages.extend(split_text(paragraph + PARAGRAPH_END, self.max_size))
+
+        if len(self.pending) > self.max_size * 16:
+            # Don't cut at a trailing newline, it may be the start of a paragraph break
+            cut = self.pending.rfind("\n", 0, len(self.pending) - 1)
+
+            if cut < 1:
+                cut = self.pending.rfind(" ", 0, len(self.pending) - 1)
+
+            if cut < 1:
+                messages.extend(split_text(self.pending[:-1], self.max_size))
+                self.pending = self.pending[-1:]
+            else:
+                messages.extend(split_text(self.pending[:cut], self.max_size))
+                self.pending = self.pending[cut + 1:]
+
+        return messages
+
+    def close(self) -> List[str]:
+        pending, self.pending = self.pending, ""
+
+        if not pending:
+            return []
+
+        return list(split_text(pending, self.max_size))
+
 
 class URLSection(BaseSection):
     _type = "url"
-    cached_lines = []
+    cacheable = False  # Streamed from the URL cache, which handles its own expiry
 
     def __init__(self, name, url=None, header="", footer=""):
         super().__init__(name, header=header, footer=footer)
@@ -31,20 +77,15 @@ class URLSection(BaseSection):
             while url[0] in "`<" and url[-1] in "`>" and url[0] == url[-1]:
                 url = url[1:-1]
 
-            session = aiohttp.ClientSession()
-
             try:
-                async with session.get(url, timeout=30) as resp:
-                    text = await resp.text()
-                self.cached_lines = self.split_paragraphs(text)
+                lines = await client.url_cache.fetch(client.http_pool, url, ParagraphSplitter)
             except Exception as e:
                 return "Failed to retrieve URL: `{}`".format(e)
             else:
                 self.url = url
+                self.invalidate()
                 client.sections_updated(message.server)
-                return "URL set; retrieved `{}` messages' worth of text".format(len(self.cached_lines))
-            finally:
-                session.close()
+                return "URL set; retrieved `{}` messages' worth of text".format(len(lines))
         if command == "get":
             if not self.url:
                 return "No URL has been set."
@@ -52,34 +93,21 @@ class URLSection(BaseSection):
 
         return "Unknown command: `{}`\n\nAvailable command: `set`, `get`".format(command)
 
-    def split_paragraphs(self, text):
-        parts = text.split("\n\n")
-        done = []
-
-        for i, part in enumerate(parts):
-            if i < len(parts) - 1:
-                done.append(part + "\n\u200b")
-            else:
-                done.append(part)
+    async def render(self, client) -> List[str]:
+        return [message async for message in self.stream(client)]
 
-        return line_splitter(done, 2000, split_only=True)
-
-    async def render(self) -> List[str]:
+    async def stream(self, client):
         if not self.url:
-            return ["**A URL has not been set for this section**"]
-
-        session = aiohttp.ClientSession()
+            yield "**A URL has not been set for this section**"
+            return
 
+        # Served from the shared cache while fresh, revalidated with a conditional request after that, and the
+        # last good copy is used if the site can't be reached
         try:
-            async with session.get(self.url, timeout=30) as resp:
-                text = await resp.text()
-            self.cached_lines = self.split_paragraphs(text)
+            async for message in client.url_cache.stream(client.http_pool, self.url, ParagraphSplitter):
+                yield message
         except Exception as e:
-            return ["**ERROR**: Failed to retrieve URL: `{}`".format(self.url, e)]
-        else:
-            return self.cached_lines
-        finally:
-            session.close()
+            yield "**ERROR**: Failed to retrieve URL: `{}`".format(self.url, e)
 
     async def show(self) -> List[str]:
         return [
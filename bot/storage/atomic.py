@@ -0,0 +1,70 @@
+# coding=utf-8
+import os
+
+__author__ = "Gareth Coles"
+
+
+class AtomicWriteBatch:
+    # Replaces a set of files so that, after a crash, every file is either entirely old or entirely new - never
+    # truncated. Everything is written to a temporary file first, and nothing is synced until `commit`, which
+    # fsyncs all of the temporary files, renames them into place, then fsyncs each directory once so that the
+    # renames are durable too. That's one round of syncs per batch, rather than one per file per edit. Directories
+    # created with `make_directory` have their parents synced as well, so that a new server's files can be found.
+
+    def __init__(self):
+        self.pending = []  # [(path, temp_path)]
+        self.created = []  # Directories we made
+
+    def __len__(self):
+        return len(self.pending)
+
+    def make_directory(self, path):
+        if not os.path.exists(path):
+            os.mkdir(path)
+            self.created.append(path)
+
+    def write(self, path, content: str):
+        temp_path = "{}.tmp".format(path)
+
+        with open(temp_path, "w", encoding="UTF-8") as fh:
+            fh.write(content)
+
+        self.pending.append((path, temp_path))
+
+    def commit(self):
+        pending, self.pending = self.pending, []
+        created, self.created = self.created, []
+
+        try:
+            for _, temp_path in pending:
+                with open(temp_path, "r+b") as fh:
+                    os.fsync(fh.fileno())
+
+            for path, temp_path in pending:
+                os.replace(temp_path, path)
+        except Exception:
+            for _, temp_path in pending:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            raise
+
+        directories = set(os.path.dirname(path) or "." for path, _ in pending)
+        directories.update(os.path.dirname(os.path.normpath(path)) or "." for path in created)
+
+        for directory in directories:
+            sync_directory(directory)
+
+
+def sync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Directories can't be opened like this on Windows, where renames don't need it anyway
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
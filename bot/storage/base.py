@@ -0,0 +1,58 @@
+# coding=utf-8
+from typing import List, Optional
+
+__author__ = "Gareth Coles"
+
+
+class StorageBackend:
+    # Server data is passed around as plain, already-serialised structures:
+    #
+    # server = {
+    #     "config": {},
+    #     "sections": [[name, type, data]],
+    #     "notes": {"number": 0, "notes": {}},
+    #     "published": {"channel": None, "messages": []}
+    # }
+    #
+    # Reads return [config, sections, notes, published], or just [config] when `config_only` is set. Notes and
+    # published messages may be None if the server has never saved any.
+    #
+    # The DataManager only calls into a backend from one thread at a time, apart from `read_raw` on backends that
+    # set `parallel` - that may be run in a process pool, so it must be a picklable, module-level function whose
+    # result is handed back to `finish_read` on the event loop.
+
+    parallel = False
+
+    def list_servers(self) -> List[str]:
+        pass
+
+    def has_server(self, server_id) -> bool:
+        pass
+
+    def read_raw(self, server_id, config_only=False):
+        pass
+
+    def finish_read(self, server_id, raw) -> Optional[List]:
+        return raw
+
+    def read_server(self, server_id, config_only=False) -> Optional[List]:
+        return self.finish_read(server_id, self.read_raw(server_id, config_only))
+
+    def write_server(self, server_id, server):
+        pass
+
+    def write_servers(self, servers):
+        # Called with every server that's due to be saved at once; backends may make this a single batch
+
+        for server_id, server in servers.items():
+            self.write_server(server_id, server)
+
+    def create_server(self, server_id, server) -> bool:
+        if self.has_server(server_id):
+            return False
+
+        self.write_server(server_id, server)
+        return True
+
+    def close(self):
+        pass
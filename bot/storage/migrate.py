@@ -0,0 +1,67 @@
+# coding=utf-8
+import logging
+import sys
+
+from bot.storage.sqlite_backend import SQLiteBackend
+from bot.storage.yaml_backend import YAMLBackend
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("Migrate")
+
+USAGE = "Usage: python -m bot.storage.migrate [--debug] [database path]"
+
+
+def migrate(source, destination) -> int:
+    migrated = 0
+
+    for server_id in source.list_servers():
+        try:
+            config, sections, notes, published = source.read_server(server_id)
+        except Exception:
+            log.exception("Failed to read server: {}".format(server_id))
+            continue
+
+        # Replaced rather than updated, so that migrating again after editing the YAML files doesn't bring back
+        # anything that's since been removed
+        destination.replace_server(server_id, {
+            "config": config,
+            "sections": sections,
+            "notes": notes,
+            "published": published
+        })
+
+        migrated += 1
+        log.debug("Migrated server: {}".format(server_id))
+
+    return migrated
+
+
+def main():
+    # Copies everything under data/ into a SQLite database. The YAML files are left alone, so you can go back by
+    # simply switching `storage` back to `yaml` in config.yml.
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+
+    if "--help" in sys.argv or len(args) > 1:
+        return print(USAGE)
+
+    path = args[0] if args else "data.sqlite"
+
+    logging.basicConfig(
+        format="%(asctime)s | %(name)10s | %(levelname)8s | %(message)s",
+        level=logging.DEBUG if "--debug" in sys.argv else logging.INFO
+    )
+
+    destination = SQLiteBackend(path)
+
+    try:
+        migrated = migrate(YAMLBackend(), destination)
+    finally:
+        destination.close()
+
+    log.info("Migrated {} servers to {}".format(migrated, path))
+
+
+if __name__ == "__main__":
+    main()
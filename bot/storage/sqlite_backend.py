@@ -0,0 +1,262 @@
+# coding=utf-8
+import datetime
+import json
+import sqlite3
+import threading
+
+from typing import List
+
+from bot.storage.base import StorageBackend
+from bot.utils import digest
+
+__author__ = "Gareth Coles"
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    id TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    note_number INTEGER NOT NULL DEFAULT 0,
+    published TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sections (
+    server_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (server_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS notes (
+    server_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (server_id, id)
+);
+"""
+
+
+def dump_note(note) -> str:
+    note = dict(note)
+
+    if isinstance(note.get("submitted"), datetime.datetime):
+        note["submitted"] = note["submitted"].strftime(DATETIME_FORMAT)
+
+    return json.dumps(note, sort_keys=True)
+
+
+def load_note(data) -> dict:
+    note = json.loads(data)
+
+    if note.get("submitted"):
+        note["submitted"] = datetime.datetime.strptime(note["submitted"], DATETIME_FORMAT)
+
+    return note
+
+
+class SQLiteBackend(StorageBackend):
+    # One row per server, per section and per note, so that editing a single note is a single-row write. We keep a
+    # digest of every row we've read or written, and only touch the rows whose contents changed. For a server we
+    # haven't read or written yet - or whose last write failed - the digests are read back from the database first,
+    # so rows that have since been removed are always deleted.
+
+    def __init__(self, path="data.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # server_id -> {"server": digest, "sections": {position: digest}, "notes": {note_id: digest}}
+        self.written = {}
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def get_written(self, server_id) -> dict:
+        if server_id not in self.written:
+            self.written[server_id] = self.read_written(server_id)
+
+        return self.written[server_id]
+
+    def read_written(self, server_id) -> dict:
+        # Digests of the server's rows as they are in the database right now
+
+        written = {"server": None, "sections": {}, "notes": {}}
+
+        row = self.connection.execute(
+            "SELECT config, note_number, published FROM servers WHERE id = ?", (server_id,)
+        ).fetchone()
+
+        if row is not None:
+            written["server"] = digest(json.dumps(row))
+
+        for position, name, section_type, data in self.connection.execute(
+                "SELECT position, name, type, data FROM sections WHERE server_id = ?", (server_id,)):
+            written["sections"][position] = digest(json.dumps([name, section_type, data]))
+
+        for note_id, data in self.connection.execute("SELECT id, data FROM notes WHERE server_id = ?", (server_id,)):
+            written["notes"][note_id] = digest(data)
+
+        return written
+
+    def list_servers(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT id FROM servers")]
+
+    def has_server(self, server_id) -> bool:
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM servers WHERE id = ?", (server_id,)).fetchone()
+
+        return row is not None
+
+    def read_raw(self, server_id, config_only=False):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT config, note_number, published FROM servers WHERE id = ?", (server_id,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            config, note_number, published = row
+
+            if config_only:
+                return [json.loads(config)]
+
+            written = self.written[server_id] = {"server": digest(json.dumps(row)), "sections": {}, "notes": {}}
+
+            sections = []
+
+            for position, name, section_type, data in self.connection.execute(
+                    "SELECT position, name, type, data FROM sections WHERE server_id = ? ORDER BY position",
+                    (server_id,)):
+                written["sections"][position] = digest(json.dumps([name, section_type, data]))
+                sections.append([name, section_type, json.loads(data)])
+
+            notes = {}
+
+            for note_id, data in self.connection.execute(
+                    "SELECT id, data FROM notes WHERE server_id = ?", (server_id,)):
+                written["notes"][note_id] = digest(data)
+                notes[note_id] = load_note(data)
+
+        return [
+            json.loads(config),
+            sections,
+            {"number": note_number, "notes": notes},
+            json.loads(published) if published else None
+        ]
+
+    def write_server(self, server_id, server):
+        self.write_servers({server_id: server})
+
+    def write_servers(self, servers):
+        # One transaction, and so one sync, for the lot
+
+        with self.lock:
+            try:
+                with self.connection:
+                    for server_id, server in servers.items():
+                        self.write_rows(server_id, server, self.get_written(server_id))
+            except Exception:
+                # The transaction was rolled back, so we no longer know what's in these rows - they'll be read back
+                # before the next write
+                for server_id in servers:
+                    self.written.pop(server_id, None)
+
+                raise
+
+    def replace_server(self, server_id, server):
+        # Writes the server from scratch, so that nothing that was already in the database for it survives
+
+        with self.lock:
+            try:
+                with self.connection:
+                    self.connection.execute("DELETE FROM servers WHERE id = ?", (server_id,))
+                    self.connection.execute("DELETE FROM sections WHERE server_id = ?", (server_id,))
+                    self.connection.execute("DELETE FROM notes WHERE server_id = ?", (server_id,))
+
+                    written = self.written[server_id] = {"server": None, "sections": {}, "notes": {}}
+                    self.write_rows(server_id, server, written)
+            except Exception:
+                self.written.pop(server_id, None)
+                raise
+
+    def write_rows(self, server_id, server, written):
+        self.write_server_row(server_id, server, written)
+
+        if server.get("sections") is not None:
+            self.write_sections(server_id, server["sections"], written["sections"])
+
+        if server.get("notes") is not None:
+            self.write_notes(server_id, server["notes"]["notes"], written["notes"])
+
+    def write_server_row(self, server_id, server, written):
+        row = (
+            json.dumps(server["config"], sort_keys=True),
+            server["notes"]["number"] if server.get("notes") else 0,
+            json.dumps(server["published"], sort_keys=True) if server.get("published") else None
+        )
+
+        row_digest = digest(json.dumps(row))
+
+        if written["server"] == row_digest:
+            return
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO servers (id, config, note_number, published) VALUES (?, ?, ?, ?)",
+            (server_id,) + row
+        )
+
+        written["server"] = row_digest
+
+    def write_sections(self, server_id, sections, written):
+        for position, (name, section_type, data) in enumerate(sections):
+            data = json.dumps(data, sort_keys=True)
+            row_digest = digest(json.dumps([name, section_type, data]))
+
+            if written.get(position) == row_digest:
+                continue
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sections (server_id, position, name, type, data) VALUES (?, ?, ?, ?, ?)",
+                (server_id, position, name, section_type, data)
+            )
+
+            written[position] = row_digest
+
+        stale = [position for position in written if position >= len(sections)]
+
+        if stale:
+            self.connection.execute(
+                "DELETE FROM sections WHERE server_id = ? AND position >= ?", (server_id, len(sections))
+            )
+
+            for position in stale:
+                del written[position]
+
+    def write_notes(self, server_id, notes, written):
+        for note_id, note in notes.items():
+            data = dump_note(note)
+            row_digest = digest(data)
+
+            if written.get(note_id) == row_digest:
+                continue
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO notes (server_id, id, data) VALUES (?, ?, ?)",
+                (server_id, note_id, data)
+            )
+
+            written[note_id] = row_digest
+
+        for note_id in [note_id for note_id in written if note_id not in notes]:
+            self.connection.execute("DELETE FROM notes WHERE server_id = ? AND id = ?", (server_id, note_id))
+            del written[note_id]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,118 @@
+# coding=utf-8
+import os
+import re
+
+from ruamel import yaml
+from typing import List
+
+from bot.storage.atomic import AtomicWriteBatch
+from bot.storage.base import StorageBackend
+from bot.utils import digest
+
+__author__ = "Gareth Coles"
+
+SERVER_REGEX = re.compile(r"[\d]+[\\/]?")
+
+FILES = [
+    ("config", "config.yml"),
+    ("sections", "sections.yml"),
+    ("notes", "notes.yml"),
+    ("published", "messages.yml")
+]
+
+
+# These live at module level so that they can be run in a process pool while loading
+
+
+def read_file(path):
+    with open(path, "r") as fh:
+        content = fh.read()
+
+    return yaml.safe_load(content), digest(content)
+
+
+def read_server_files(server_id, config_only=False):
+    if not os.path.exists("data/{}".format(server_id)):
+        return None
+
+    digests = {}
+    loaded = []
+
+    for key, filename in FILES:
+        path = "data/{}/{}".format(server_id, filename)
+
+        if key in ("notes", "published") and not os.path.exists(path):
+            loaded.append(None)
+        else:
+            data, digests[path] = read_file(path)
+            loaded.append(data)
+
+        if config_only:
+            break
+
+    return loaded, digests
+
+
+class YAMLBackend(StorageBackend):
+    # The original layout: data/<server_id>/{config,sections,notes,messages}.yml
+
+    parallel = True
+    read_raw = staticmethod(read_server_files)
+
+    def __init__(self):
+        # Digest of what we last read from or wrote to each file, so unchanged files are never rewritten
+        self.written = {}
+
+        if not os.path.exists("data"):
+            os.mkdir("data")
+
+    def list_servers(self) -> List[str]:
+        servers = []
+
+        for fn in os.listdir("data/"):
+            if os.path.isdir("data/{}".format(fn)):
+                if SERVER_REGEX.match(fn):
+                    if fn[-1] in "\\/":
+                        fn = fn[:-1]
+
+                    servers.append(fn)
+
+        return servers
+
+    def has_server(self, server_id) -> bool:
+        return os.path.exists("data/{}".format(server_id))
+
+    def finish_read(self, server_id, raw):
+        if raw is None:
+            return None
+
+        loaded, digests = raw
+        self.written.update(digests)
+
+        return loaded
+
+    def write_server(self, server_id, server):
+        self.write_servers({server_id: server})
+
+    def write_servers(self, servers):
+        batch = AtomicWriteBatch()
+        digests = {}
+
+        for server_id, server in servers.items():
+            batch.make_directory("data/{}".format(server_id))
+
+            for key, filename in FILES:
+                if server.get(key) is None:
+                    continue
+
+                path = "data/{}/{}".format(server_id, filename)
+                content = yaml.safe_dump(server[key])
+                content_digest = digest(content)
+
+                if self.written.get(path) != content_digest:
+                    batch.write(path, content)
+                    digests[path] = content_digest
+
+        if batch:
+            batch.commit()
+            self.written.update(digests)
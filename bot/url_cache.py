@@ -0,0 +1,206 @@
+# coding=utf-8
+import codecs
+import logging
+import time
+
+import asyncio
+
+from collections import OrderedDict
+from typing import List
+
+__author__ = "Gareth Coles"
+
+log = logging.getLogger("URLCache")
+
+DEFAULT_TTL = 300  # Seconds before we ask the server whether a page has changed
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024  # Characters, across every cached page
+DEFAULT_MAX_PAGE_SIZE = 5 * 1024 * 1024  # Bytes; we refuse to download anything bigger
+DEFAULT_TIMEOUT = 30
+
+CHUNK_SIZE = 16384
+
+
+class URLFetchError(Exception):
+    pass
+
+
+def get_charset(content_type) -> str:
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.partition("=")
+
+        if key.strip().lower() == "charset":
+            return value.strip().strip("\"'")
+
+    return "utf-8"
+
+
+def get_decoder(content_type):
+    try:
+        return codecs.getincrementaldecoder(get_charset(content_type))(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+class CacheEntry:
+    def __init__(self, lines, etag=None, last_modified=None):
+        self.lines = lines
+        self.etag = etag
+        self.last_modified = last_modified
+
+        self.size = sum(len(line) for line in lines)
+        self.fetched = time.monotonic()
+
+
+class URLCache:
+    # Processed page contents for URL sections, keyed by URL and shared between every server. Entries are served
+    # as-is until they're `ttl` seconds old, then revalidated with a conditional request - a 304 just refreshes
+    # the entry. If a fetch fails, we fall back to whatever we have cached, however old. The least recently used
+    # pages are evicted once the cache holds more than `max_size` characters.
+    #
+    # Pages are downloaded in chunks and split into messages as they arrive, so we never hold the whole document
+    # as one string. When there's no cached copy, whoever is publishing can start sending before the download has
+    # finished; when there is one, a fresh copy is held back until it's complete, so that a failed download can
+    # still fall back to it.
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, max_page_size=DEFAULT_MAX_PAGE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_page_size = max_page_size
+
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, url) -> CacheEntry:
+        entry = self.entries.get(url)
+
+        if entry is not None:
+            self.entries.move_to_end(url)
+
+        return entry
+
+    def put(self, url, entry: CacheEntry):
+        self.discard(url)
+
+        self.entries[url] = entry
+        self.size += entry.size
+
+        while self.size > self.max_size and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def discard(self, url):
+        entry = self.entries.pop(url, None)
+
+        if entry is not None:
+            self.size -= entry.size
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.fetched < self.ttl
+
+    async def fetch(self, pool, url, splitter, timeout=DEFAULT_TIMEOUT) -> List[str]:
+        return [message async for message in self.stream(pool, url, splitter, timeout=timeout)]
+
+    async def stream(self, pool, url, splitter, timeout=DEFAULT_TIMEOUT):
+        # Yields the page's messages. `splitter` is called to create an object with `feed(text)` and `close()`
+        # methods, each returning a list of the messages completed so far.
+
+        entry = self.get(url)
+
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+
+            for message in entry.lines:
+                yield message
+
+            return
+
+        headers = {}
+
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        lines = []
+        streaming = entry is None  # Nothing to fall back on, so there's no reason to hold anything back
+
+        try:
+            async with pool.get(url, timeout=timeout, headers=headers) as resp:
+                if resp.status == 304 and entry is not None:
+                    self.revalidated += 1
+                    entry.fetched = time.monotonic()
+                else:
+                    if resp.status >= 400:
+                        raise URLFetchError("HTTP {} {}".format(resp.status, resp.reason))
+
+                    entry = None
+
+                    etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+                    length = resp.headers.get("Content-Length")
+
+                    if length and length.isdigit() and int(length) > self.max_page_size:
+                        raise URLFetchError("Page is larger than {} bytes".format(self.max_page_size))
+
+                    decoder = get_decoder(resp.headers.get("Content-Type"))
+                    page = splitter()
+                    size = 0
+
+                    while True:
+                        data = await resp.content.read(CHUNK_SIZE)
+
+                        if not data:
+                            break
+
+                        size += len(data)
+
+                        if size > self.max_page_size:
+                            raise URLFetchError("Page is larger than {} bytes".format(self.max_page_size))
+
+                        for message in page.feed(decoder.decode(data)):
+                            lines.append(message)
+
+                            if streaming:
+                                yield message
+
+                    for message in page.feed(decoder.decode(b"", final=True)) + page.close():
+                        lines.append(message)
+
+                        if streaming:
+                            yield message
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            cached = self.get(url)
+
+            if cached is None or (streaming and lines):
+                # Nothing to fall back on, or we've already sent part of a fresh copy
+                raise
+
+            log.warning("Failed to fetch {}, serving cached copy: {}".format(url, e))
+            self.stale += 1
+
+            entry = cached
+
+        if entry is not None:
+            # Not modified, or the fetch failed and we're serving what we had
+            for message in entry.lines:
+                yield message
+
+            return
+
+        self.misses += 1
+        self.put(url, CacheEntry(lines, etag, last_modified))
+
+        if not streaming:
+            for message in lines:
+                yield message
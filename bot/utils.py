@@ -1,33 +1,76 @@
 # coding=utf-8
+import hashlib
+
+from typing import Iterable, Iterator, List
 
 __author__ = "Gareth Coles"
 
+SEPARATORS = ("\n\n", "\n", " ")  # Paragraphs, then lines, then words
+
+
+def digest(content: str) -> str:
+    return hashlib.sha1(content.encode("UTF-8")).hexdigest()
+
+
+def iter_chunks(parts: Iterable[str], max_size: int, separator="\n", fallback=SEPARATORS) -> Iterator[str]:
+    # Packs parts into chunks of at most max_size characters, joined with the separator. Each chunk is built in a
+    # list and joined once, so this is linear in the size of the input. A part that's too long on its own is split
+    # up with split_text, using the fallback separators. Chunks that would be empty or only whitespace - from a part
+    # that starts with a separator, say - are skipped, since Discord won't send an empty message.
+
+    current = []
+    length = 0
+
+    for part in parts:
+        if len(part) > max_size:
+            if current:
+                yield from non_empty(separator.join(current))
+                current, length = [], 0
+
+            yield from split_text(part, max_size, fallback)
+            continue
+
+        added = len(part) + len(separator) if current else len(part)
+
+        if length + added > max_size:
+            yield from non_empty(separator.join(current))
+            current, length = [], 0
+            added = len(part)
+
+        current.append(part)
+        length += added
+
+    if current:
+        yield from non_empty(separator.join(current))
+
+
+def non_empty(chunk: str) -> Iterator[str]:
+    if chunk.strip():
+        yield chunk
+
 
-def line_splitter(lines, max_size, split_only=False):
-    finished_lines = []
-    current_line = ""
+def split_text(text: str, max_size: int, separators=SEPARATORS) -> Iterator[str]:
+    # Splits text into pieces of at most max_size characters, breaking on the first of the separators that the
+    # text contains and falling back to the next ones for anything still too long. Text with no separators left is
+    # simply cut up.
 
-    if not split_only:
-        for line in lines:
-            if len(current_line) + len(line) + 2 >= max_size:
-                if not current_line:
-                    raise ValueError("Encountered a line longer than {} characters".format(max_size))
+    if len(text) <= max_size:
+        yield from non_empty(text)
+        return
 
-                finished_lines.append(current_line)
-                current_line = ""
+    for i, separator in enumerate(separators):
+        if separator in text:
+            yield from iter_chunks(text.split(separator), max_size, separator, separators[i + 1:])
+            return
 
-            current_line += "\n{}".format(line)
+    for start in range(0, len(text), max_size):
+        yield text[start:start + max_size]
 
-        if current_line:
-            finished_lines.append(current_line)
-    else:
-        for line in lines:
-            current_line = line
 
-            while len(current_line) + 2 >= max_size:
-                finished_lines.append(current_line[:max_size-2])
-                current_line = current_line[max_size-2:]
-            else:
-                finished_lines.append(current_line)
+def line_splitter(lines, max_size, split_only=False) -> List[str]:
+    if split_only:
+        # Each line becomes one or more messages of its own
+        return [chunk for line in lines for chunk in split_text(line, max_size - 2)]
 
-    return finished_lines
+    # Lines are packed into messages, each line starting with a newline
+    return ["\n" + chunk for chunk in iter_chunks(lines, max_size - 3)]